@@ -0,0 +1,64 @@
+"""
+Import time of pynexus, measured in fresh interpreters.
+
+    python -m benchmarks.import_time [--runs 10]
+
+Also checks that the import has no side effect on the filesystem and does not load
+the heavy dependencies (requests, tqdm, coloredlogs, ipywidgets).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STATEMENTS = {
+    'python': 'pass',
+    'import pynexus': 'import pynexus',
+    'from pynexus import AppNexusAPI': 'from pynexus import AppNexusAPI',
+    'from pynexus import ReportsAPI': 'from pynexus import ReportsAPI',
+}
+
+HEAVY_MODULES = ['requests', 'tqdm', 'coloredlogs', 'ipywidgets', 'traitlets']
+
+PROBE = '''
+import json, sys, time
+t0 = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - t0
+print(json.dumps({{"elapsed": elapsed, "modules": [m for m in {heavy} if m in sys.modules]}}))
+'''
+
+
+def run(statement):
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    out = subprocess.check_output([sys.executable, '-c', PROBE.format(statement=statement, heavy=HEAVY_MODULES)],
+                                  env=env, cwd=ROOT)
+    return json.loads(out.decode('utf-8').strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10, help='number of interpreters started per statement')
+    args = parser.parse_args(argv)
+
+    before = set(os.listdir(ROOT))
+
+    print('%-35s %12s  %s' % ('statement', 'median (ms)', 'heavy modules loaded'))
+    for name, statement in STATEMENTS.items():
+        results = [run(statement) for _ in range(args.runs)]
+        median = statistics.median(x['elapsed'] for x in results) * 1000
+        print('%-35s %12.2f  %s' % (name, median, ', '.join(results[-1]['modules']) or '-'))
+
+    created = set(os.listdir(ROOT)) - before
+    if created:
+        print('files created by the import: %s' % ', '.join(sorted(created)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
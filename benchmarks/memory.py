@@ -0,0 +1,73 @@
+"""
+Memory retained by the results of `bulk_request_get_all`: plain dicts and lists of responses
+against the compact containers (cf `pynexus.containers`).
+
+    python -m benchmarks.memory [--objects 1000000]
+
+The pages are generated in memory, like the ones of the segment service, so no server is needed.
+"""
+import argparse
+import gc
+import sys
+import time
+import tracemalloc
+
+from pynexus import progress
+from pynexus.base_api import BaseAPI
+
+
+def segment_service(count, members=50):
+    """A get function returning the pages of a catalog of `count` segments"""
+
+    def get_segment(start_element=0, num_elements=100, only_names=True, fields=None, **kwargs):
+        stop = min(count, start_element + num_elements)
+        segments = [{'id': i, 'short_name': 'segment %d' % i, 'member_id': i % members, 'state': 'active',
+                     'code': None, 'price': 0.} for i in range(start_element + 1, stop + 1)]
+        if only_names:
+            return {x['id']: x['short_name'] for x in segments}
+        return {'status': 'OK', 'count': count, 'start_element': start_element, 'num_elements': num_elements,
+                'segments': segments}
+
+    return get_segment
+
+
+def retained(build):
+    """
+    Memory retained by the result of `build` and the time to build it
+    :return: (bytes, seconds)
+    """
+    gc.collect()
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - t0
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size, elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--objects', type=int, default=200000, help='number of objects of the catalog')
+    args = parser.parse_args(argv)
+
+    progress.set_progress_backend(progress.NONE)
+    func = segment_service(args.objects)
+    cases = [
+        ('names: dict', lambda: BaseAPI.bulk_request_get_all(func)),
+        ('names: NameTable', lambda: BaseAPI.bulk_request_get_all(func, compact=True)),
+        ('objects: list of responses', lambda: BaseAPI.bulk_request_get_all(func, only_names=False)),
+        ('objects: RecordTable', lambda: BaseAPI.bulk_request_get_all(func, only_names=False, compact=True)),
+    ]
+
+    print('%-30s %14s %12s %10s' % ('result (%d objects)' % args.objects, 'retained (MiB)', 'bytes/obj', 'time (s)'))
+    for name, build in cases:
+        size, elapsed = retained(build)
+        print('%-30s %14.1f %12.1f %10.3f' % (name, size / 2. ** 20, float(size) / args.objects, elapsed))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,273 @@
+"""
+Local stand-in for the AppNexus API, used by the benchmarks.
+
+Emulates `/auth`, `/member`, the paginated catalog services (`/campaign`, `/line-item`...),
+the report service (submit, poll, download) and the batch segment upload service.
+"""
+import gzip
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+CATALOG_SERVICES = ['campaign', 'line-item', 'advertiser', 'insertion-order', 'pixel', 'creative',
+                    'segment', 'publisher', 'device-model', 'browser', 'operating-system',
+                    'operating-system-extended', 'country', 'city', 'inventory-resold', 'custom-model']
+
+RESPONSE_KEYS = {'operating-system-extended': 'operating-systems-extended'}
+
+
+class MockAppNexusServer(object):
+    """
+    HTTP server emulating the AppNexus API, running in a background thread
+
+    Usage:
+        with MockAppNexusServer(latency=0.01) as server:
+            api = rebase(AppNexusAPI, server.url)('user', 'password')
+    """
+
+    def __init__(self, catalog_size=1000, object_size=2000, latency=0., rate_limit_every=0,
+                 auth_ttl=None, report_rows=10000, report_polls=1, segment_polls=1, slow_every=0, slow_latency=1.,
+                 host='127.0.0.1', port=0):
+        """
+        :param catalog_size: number of objects per catalog service
+        :param object_size: size (in bytes) of the padding added to each object
+        :param latency: delay (in seconds) added to each response
+        :param rate_limit_every: answer RATE_EXCEEDED to one request out of `rate_limit_every` (0: never)
+        :param auth_ttl: lifetime (in seconds) of the tokens, after which NOAUTH is answered (None: never)
+        :param report_rows: number of rows of the reports
+        :param report_polls: number of polls answered `pending` before a report is ready
+        :param segment_polls: number of polls before a segment upload job is completed
+        :param slow_every: delay by `slow_latency` one request out of `slow_every` (0: never), like a slow node
+        :param slow_latency: delay (in seconds) of the slow requests
+        """
+        self.catalog_size = catalog_size
+        self.object_size = object_size
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.auth_ttl = auth_ttl
+        self.report_rows = report_rows
+        self.report_polls = report_polls
+        self.segment_polls = segment_polls
+        self.slow_every = slow_every
+        self.slow_latency = slow_latency
+
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.counts = {}
+        self.tokens = {}
+        self.reports = {}
+        self.jobs = {}
+        self._catalogs = {}
+        self._reports_data = {}
+
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return 'http://%s:%d' % (host, port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def catalog(self, service):
+        with self.lock:
+            if service not in self._catalogs:
+                name_key = 'short_name' if service == 'segment' else 'name'
+                padding = 'x' * self.object_size
+                self._catalogs[service] = [
+                    {'id': i, name_key: '%s %d' % (service, i), 'state': 'active',
+                     'advertiser_id': i % 10 + 1, 'description': padding}
+                    for i in range(1, self.catalog_size + 1)]
+            return self._catalogs[service]
+
+    def report_csv(self, rows):
+        if rows in self._reports_data:
+            return self._reports_data[rows]
+        lines = ['hour,advertiser_id,line_item_id,campaign_id,imps,clicks']
+        rnd = random.Random(rows)
+        for i in range(rows):
+            lines.append('2017-01-01 %02d:00:00,%d,%d,%d,%d,%d' % (
+                i % 24, rnd.randint(1, 10), rnd.randint(1, 1000), rnd.randint(1, 1000),
+                rnd.randint(0, 10000), rnd.randint(0, 100)))
+        data = self._reports_data[rows] = ('\n'.join(lines) + '\n').encode('utf-8')
+        return data
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, content_type='application/json', headers=None):
+                data = body if isinstance(body, bytes) else json.dumps({'response': body}).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _read_body(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                return self.rfile.read(length) if length else b''
+
+            def _token(self):
+                cookie = self.headers.get('Cookie') or ''
+                for part in cookie.split(';'):
+                    k, _, v = part.strip().partition('=')
+                    if k == 'token':
+                        return v
+                return self.headers.get('Authorization')
+
+            def _handle(self, method):
+                url = urlsplit(self.path)
+                path = url.path.strip('/')
+                params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                body = self._read_body()
+
+                with server.lock:
+                    server.request_count += 1
+                    server.counts[path] = server.counts.get(path, 0) + 1
+                    request_count = server.request_count
+
+                if server.latency:
+                    time.sleep(server.latency)
+                if server.slow_every and request_count % server.slow_every == 0:
+                    time.sleep(server.slow_latency)
+
+                if path == 'auth':
+                    token = uuid.uuid4().hex
+                    with server.lock:
+                        server.tokens[token] = time.time()
+                    return self._send(200, {'status': 'OK', 'token': token},
+                                      headers={'Set-Cookie': 'token=%s; Path=/' % token})
+
+                token = self._token()
+                with server.lock:
+                    created = server.tokens.get(token)
+                if created is None or (server.auth_ttl and time.time() - created > server.auth_ttl):
+                    return self._send(401, {'error_id': 'NOAUTH', 'error': 'Authentication failed - not logged in'})
+
+                if server.rate_limit_every and request_count % server.rate_limit_every == 0:
+                    return self._send(429, {'error_id': 'SYSTEM', 'error_code': 'RATE_EXCEEDED',
+                                            'error': 'You have exceeded your request limit'})
+
+                if path == 'member':
+                    return self._send(200, {'status': 'OK', 'member': {'id': 1}})
+                if path == 'report':
+                    return self._report(method, params, body)
+                if path == 'report-download':
+                    return self._send(200, server.reports[params['id']]['data'], content_type='text/csv')
+                if path == 'batch-segment':
+                    return self._batch_segment(method, params)
+                if path == 'segment-upload':
+                    return self._segment_upload(params, body)
+                if path in CATALOG_SERVICES and method == 'GET':
+                    return self._catalog(path, params)
+                return self._send(404, {'error_id': 'NOTFOUND', 'error': 'Unknown service %s' % path})
+
+            def _catalog(self, service, params):
+                objects = server.catalog(service)
+                if 'id' in params:
+                    ids = {int(x) for x in params['id'].split(',')}
+                    objects = [x for x in objects if x['id'] in ids]
+                if 'advertiser_id' in params:
+                    objects = [x for x in objects if x['advertiser_id'] == int(params['advertiser_id'])]
+
+                count = len(objects)
+                start = int(params.get('start_element', 0))
+                num = min(int(params.get('num_elements', 100)), 100)
+                objects = objects[start: start + num]
+                if 'fields' in params:
+                    fields = params['fields'].split(',')
+                    objects = [{f: x[f] for f in fields if f in x} for x in objects]
+
+                key = RESPONSE_KEYS.get(service, '%ss' % service)
+                return self._send(200, {'status': 'OK', 'count': count, 'start_element': start,
+                                        'num_elements': num, key: objects})
+
+            def _report(self, method, params, body):
+                if method == 'POST':
+                    report_id = uuid.uuid4().hex
+                    with server.lock:
+                        server.reports[report_id] = {'polls': 0, 'request': json.loads(body.decode('utf-8')),
+                                                     'data': server.report_csv(server.report_rows),
+                                                     'created_on': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())}
+                    return self._send(200, {'status': 'OK', 'report_id': report_id})
+                if 'id' not in params:
+                    reports = [{'id': k, 'json_request': json.dumps(v['request']), 'created_on': v['created_on'],
+                                'execution_status': 'ready' if v['polls'] > server.report_polls else 'pending'}
+                               for k, v in server.reports.items()]
+                    return self._send(200, {'status': 'OK', 'reports': reports})
+
+                report = server.reports[params['id']]
+                with server.lock:
+                    report['polls'] += 1
+                    ready = report['polls'] > server.report_polls
+                if not ready:
+                    return self._send(200, {'status': 'OK', 'execution_status': 'pending'})
+                return self._send(200, {'status': 'OK', 'execution_status': 'ready',
+                                        'report': {'url': 'report-download?id=%s' % params['id'],
+                                                   'report_size': len(report['data'])}})
+
+            def _batch_segment(self, method, params):
+                if method == 'POST':
+                    job_id = uuid.uuid4().hex
+                    with server.lock:
+                        server.jobs[job_id] = {'polls': 0, 'size': 0}
+                    upload_url = '%s/segment-upload?job_id=%s' % (server.url, job_id)
+                    return self._send(200, {'status': 'OK', 'batch_segment_upload_job': {
+                        'upload_url': upload_url, 'job_id': job_id}})
+
+                job = server.jobs[params['job_id']]
+                with server.lock:
+                    job['polls'] += 1
+                    percent = min(100, 100 * job['polls'] // max(server.segment_polls, 1))
+                return self._send(200, {'status': 'OK', 'batch_segment_upload_job': {
+                    'job_id': params['job_id'], 'percent_complete': percent, 'num_valid': job['size'],
+                    'num_invalid_user': 0, 'num_other_error': 0}})
+
+            def _segment_upload(self, params, body):
+                if body[:2] == b'\x1f\x8b':
+                    body = gzip.decompress(body)
+                with server.lock:
+                    server.jobs[params['job_id']]['size'] = len(body.splitlines())
+                return self._send(200, {'status': 'OK', 'segment_upload': {'job_id': params['job_id']}})
+
+            def do_GET(self):
+                self._handle('GET')
+
+            def do_POST(self):
+                self._handle('POST')
+
+            def do_PUT(self):
+                self._handle('PUT')
+
+            def do_DELETE(self):
+                self._handle('DELETE')
+
+        return Handler
@@ -0,0 +1,174 @@
+"""
+Offline benchmarks of pynexus against the local AppNexus API stand-in.
+
+    python -m benchmarks.run                       # run all the benchmarks
+    python -m benchmarks.run --latency 0.005 --save baseline.json
+    python -m benchmarks.run --compare baseline.json   # exit code 1 on regression
+"""
+import argparse
+import sys
+
+from pynexus import progress
+from pynexus.api import AppNexusAPI
+from pynexus.reports import ReportsAPI
+from pynexus.segments import SegmentAPI
+from pynexus.reports.settings import network_analytics_fields
+
+from .mock_server import MockAppNexusServer
+from .utils import rebase, measure, report, save, compare
+
+
+def bench_bulk_request_get_all(server, args):
+    api = rebase(AppNexusAPI, server.url)('user', 'password')
+    names = lambda: AppNexusAPI.bulk_request_get_all(api.get_line_item)
+    full = lambda: AppNexusAPI.bulk_request_get_all(api.get_line_item, only_names=False)
+    return [measure('bulk_request_get_all[names]', names, server, args.repeat),
+            measure('bulk_request_get_all[full]', full, server, args.repeat)]
+
+
+def bench_bulk_requests(server, args):
+    api = rebase(AppNexusAPI, server.url)('user', 'password')
+    ids = list(range(1, server.catalog_size + 1))
+    names = lambda: AppNexusAPI.bulk_requests(api.get_campaign, ids)
+    full = lambda: AppNexusAPI.bulk_requests(api.get_campaign, ids, only_names=False)
+    return [measure('bulk_requests[names]', names, server, args.repeat),
+            measure('bulk_requests[full]', full, server, args.repeat)]
+
+
+def bench_get_reports(server, args):
+    from pynexus.reports.registry import ReportRegistry
+
+    api = rebase(ReportsAPI, server.url)('user', 'password', report_registry=None)
+    reports = {'report_%d' % i: network_analytics_fields for i in range(args.reports)}
+    reused = lambda: rebase(ReportsAPI, server.url)('user', 'password', report_registry=ReportRegistry())
+    return [measure('ReportsAPI.get_reports', lambda: api.get_reports(reports), server, args.repeat),
+            measure('ReportsAPI.get_reports[reused]', lambda: reused().get_reports(reports), server, args.repeat)]
+
+
+def bench_download_file(server, args):
+    api = rebase(ReportsAPI, server.url)('user', 'password')
+    report_id = api._make_request(method='POST', url=api.report_url, json=network_analytics_fields)['report_id']
+    url = '%s/report-download?id=%s' % (server.url, report_id)
+    api._make_request(method='GET', url=api.report_url, params={'id': report_id})
+    return [measure('_download_file', lambda: api._download_file(url), server, args.repeat)]
+
+
+def bench_enrich_report(server, args):
+    from pynexus.reports import ReportEnricher
+
+    api = rebase(ReportsAPI, server.url)('user', 'password', report_registry=None)
+    enricher = lambda: ReportEnricher(rebase(AppNexusAPI, server.url)('user', 'password'))
+    return [measure('ReportsAPI.get_report[enriched]',
+                    lambda: api.get_report(network_analytics_fields, enricher=enricher()), server, args.repeat)]
+
+
+def bench_hedging(server, args):
+    from pynexus.resilience import Hedger
+
+    def pages(api):
+        for i in range(args.pages):
+            api.get_line_item(start_element=i % 20 * 100, num_elements=100, only_names=False)
+
+    api = rebase(AppNexusAPI, server.url)('user', 'password')
+    hedged = rebase(AppNexusAPI, server.url)('user', 'password', hedger=Hedger())
+    pages(hedged)  # latencies of the endpoint
+
+    server.slow_every = args.slow_every
+    try:
+        return [measure('catalog pages[slow node]', lambda: pages(api), server, args.repeat),
+                measure('catalog pages[slow node, hedged]', lambda: pages(hedged), server, args.repeat)]
+    finally:
+        server.slow_every = 0
+
+
+def bench_transport(server, args):
+    from concurrent.futures import ThreadPoolExecutor
+    from pynexus.transport import HttpxTransport
+
+    def lookups(api):
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            list(executor.map(lambda i: api.get_campaign(one_id=i % server.catalog_size + 1), range(args.lookups)))
+
+    measures = [measure('single lookups[requests]', lambda: lookups(rebase(AppNexusAPI, server.url)('user', 'password')),
+                        server, args.repeat)]
+    try:
+        transport = HttpxTransport(http2=True)
+    except ImportError:
+        print('httpx[http2] is not installed, the httpx transport is not measured')
+        return measures
+
+    # the mock server speaks HTTP/1.1 in clear, against the API the connections negotiate HTTP/2
+    api = rebase(AppNexusAPI, server.url)('user', 'password', transport=transport)
+    measures.append(measure('single lookups[httpx]', lambda: lookups(api), server, args.repeat))
+    transport.close()
+    return measures
+
+
+def bench_upload_segment(server, args):
+    from pynexus.segments.upload import format_data
+
+    api = rebase(SegmentAPI, server.url)('user', 'password')
+    data = format_data('\n'.join(str(x) for x in range(args.segment_users)), 1234)
+    return [measure('SegmentAPI.upload_segment', lambda: api.upload_segment(data, member_id=1),
+                    server, args.repeat)]
+
+
+BENCHMARKS = {
+    'bulk_request_get_all': bench_bulk_request_get_all,
+    'bulk_requests': bench_bulk_requests,
+    'get_reports': bench_get_reports,
+    'download_file': bench_download_file,
+    'enrich_report': bench_enrich_report,
+    'hedging': bench_hedging,
+    'transport': bench_transport,
+    'upload_segment': bench_upload_segment,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', nargs='*', choices=sorted(BENCHMARKS), help='benchmarks to run')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per benchmark, the best one is kept')
+    parser.add_argument('--latency', type=float, default=0., help='latency added by the server (s)')
+    parser.add_argument('--rate-limit-every', type=int, default=0,
+                        help='answer RATE_EXCEEDED to one request out of N')
+    parser.add_argument('--auth-ttl', type=float, default=None, help='lifetime of the tokens (s)')
+    parser.add_argument('--catalog-size', type=int, default=2000, help='objects per catalog service')
+    parser.add_argument('--report-rows', type=int, default=50000, help='rows per report')
+    parser.add_argument('--reports', type=int, default=3, help='reports fetched by get_reports')
+    parser.add_argument('--segment-users', type=int, default=100000, help='users per segment upload')
+    parser.add_argument('--lookups', type=int, default=500, help='single lookups made by the transport benchmark')
+    parser.add_argument('--concurrency', type=int, default=16, help='threads of the transport benchmark')
+    parser.add_argument('--pages', type=int, default=100, help='catalog pages fetched by the hedging benchmark')
+    parser.add_argument('--slow-every', type=int, default=25,
+                        help='one request out of N is slow (1s) in the hedging benchmark')
+    parser.add_argument('--progress', default=progress.NONE, choices=[progress.NONE, progress.TQDM],
+                        help='progress backend used by the clients')
+    parser.add_argument('--save', help='write the results to this json file')
+    parser.add_argument('--compare', help='json file of results to compare to')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='accepted relative regression')
+    args = parser.parse_args(argv)
+
+    progress.set_progress_backend(args.progress)
+
+    measures = []
+    with MockAppNexusServer(catalog_size=args.catalog_size, latency=args.latency,
+                            rate_limit_every=args.rate_limit_every, auth_ttl=args.auth_ttl,
+                            report_rows=args.report_rows) as server:
+        for name in args.only or sorted(BENCHMARKS):
+            measures.extend(BENCHMARKS[name](server, args))
+
+    report(measures)
+
+    if args.save:
+        save(measures, args.save)
+    if args.compare:
+        regressions = compare(measures, args.compare, args.tolerance)
+        for regression in regressions:
+            print('REGRESSION %s' % regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
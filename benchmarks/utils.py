@@ -0,0 +1,83 @@
+import gc
+import json
+import time
+import tracemalloc
+from collections import namedtuple
+
+from pynexus.base_api import BaseAPI
+
+Measure = namedtuple('Measure', ['name', 'seconds', 'peak_memory', 'requests'])
+
+
+def rebase(api_class, base_url, poll_interval=0.01, rate_limit_sleep=0.05):
+    """
+    Subclass of `api_class` whose urls point to `base_url` instead of the AppNexus API
+    :param api_class: the API class (ex: AppNexusAPI)
+    :param base_url: url of the server to use
+    :param poll_interval: time between two polls of a report or an upload job
+    :param rate_limit_sleep: time to wait after a RATE_EXCEEDED error
+    :return: the new class
+    """
+    attrs = {'poll_interval': poll_interval, 'rate_limit_sleep': rate_limit_sleep}
+    for cls in reversed(api_class.__mro__):
+        for name, value in vars(cls).items():
+            if isinstance(value, str) and value.startswith((BaseAPI.base_url, BaseAPI.base_url_adnxs)):
+                value = value.replace(BaseAPI.base_url_adnxs, base_url).replace(BaseAPI.base_url, base_url)
+                attrs[name] = value
+    return type(api_class.__name__, (api_class,), attrs)
+
+
+def measure(name, func, server=None, repeat=1):
+    """
+    Run `func` `repeat` times and return the best duration and the peak of memory allocated
+    :param name: name of the benchmark
+    :param func: function without argument to run
+    :param server: the mock server, to count the requests made
+    :param repeat: number of runs
+    :return: Measure
+    """
+    best, peak, requests = None, 0, 0
+    for _ in range(repeat):
+        gc.collect()
+        start_count = server.request_count if server else 0
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - t0
+        _, run_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        best = elapsed if best is None else min(best, elapsed)
+        peak = max(peak, run_peak)
+        requests = server.request_count - start_count if server else 0
+    return Measure(name, best, peak, requests)
+
+
+def report(measures):
+    print('%-35s %10s %12s %9s' % ('benchmark', 'time (s)', 'peak (KiB)', 'requests'))
+    for m in measures:
+        print('%-35s %10.4f %12.1f %9d' % (m.name, m.seconds, m.peak_memory / 1024., m.requests))
+
+
+def save(measures, path):
+    with open(path, 'w') as f:
+        json.dump({m.name: m._asdict() for m in measures}, f, indent=2)
+
+
+def compare(measures, path, tolerance=0.2):
+    """
+    Compare `measures` to the ones saved in `path`
+    :param tolerance: relative slowdown / memory increase accepted
+    :return: list of the regressions found
+    """
+    with open(path) as f:
+        baseline = json.load(f)
+
+    regressions = []
+    for m in measures:
+        ref = baseline.get(m.name)
+        if not ref:
+            continue
+        for field in ('seconds', 'peak_memory'):
+            if ref[field] and getattr(m, field) > ref[field] * (1 + tolerance):
+                regressions.append('%s: %s %.4g -> %.4g' % (m.name, field, ref[field], getattr(m, field)))
+    return regressions
@@ -1,9 +1,4 @@
-from .bonsai import BonsaiAPI
-from .reports import ReportsAPI
-from .segments import SegmentAPI
-from .direct_api import AppNexusDirectAPI
-from .api import AppNexusAPI
-
+import importlib
 import logging
 
 logging.getLogger("pynexus").setLevel(logging.INFO)
@@ -11,4 +6,26 @@ logging.getLogger("pynexus").setLevel(logging.INFO)
 # exposing package version number
 __version__ = "1.2.0"
 
+# the subpackages are only imported when one of their objects is used
+_lazy_imports = {
+    "BonsaiAPI": ".bonsai",
+    "ReportsAPI": ".reports",
+    "SegmentAPI": ".segments",
+    "AppNexusDirectAPI": ".direct_api",
+    "AppNexusAPI": ".api",
+    "setup_logging": ".logs",
+}
+
+__all__ = sorted(_lazy_imports)
+
+
+def __getattr__(name):
+    if name not in _lazy_imports:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(importlib.import_module(_lazy_imports[name], __name__), name)
+    globals()[name] = value
+    return value
+
 
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
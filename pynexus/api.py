@@ -1,4 +1,4 @@
-from .base_api import BaseAPI
+from .base_api import BaseAPI, NoTransactionDataError
 
 
 class AppNexusAPI(BaseAPI):
@@ -27,132 +27,170 @@ class AppNexusAPI(BaseAPI):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-    def get_campaign(self, ids=None, one_id=None, advertiser_id=None, only_names=True, **kwargs):
+    def get_campaign(self, ids=None, one_id=None, advertiser_id=None, only_names=True, fields=None, **kwargs):
         params = BaseAPI._get_params(ids=ids, one_id=one_id, advertiser_id=advertiser_id, **kwargs)
-        resp = self._make_request(method="GET", url=self.campaign_url,
-                                  params=params)
-        resp = self._get_names(resp, 'campaign') if only_names else resp
-        return resp
+        return self._get_resource(self.campaign_url, 'campaign', params, only_names, fields)
 
     def get_pixel(self, ids=None, one_id=None, advertiser_id=None,
-                  advertiser_code=None, pixel_code=None, only_names=True, **kwargs):
+                  advertiser_code=None, pixel_code=None, only_names=True, fields=None, **kwargs):
         params = BaseAPI._get_params(ids=ids, one_id=one_id, advertiser_id=advertiser_id,
                                      advertiser_code=advertiser_code, code=pixel_code, **kwargs)
-        resp = self._make_request(method="GET", url=self.pixel_url, params=params)
-        resp = self._get_names(resp, 'pixel') if only_names else resp
-
-        return resp
+        return self._get_resource(self.pixel_url, 'pixel', params, only_names, fields)
 
-    def get_device(self, one_id=None, device_type=None, only_names=True, **kwargs):
+    def get_device(self, one_id=None, device_type=None, only_names=True, fields=None, **kwargs):
         # TODO: implement meta
         params = BaseAPI._get_params(one_id=one_id, device_type=device_type,  **kwargs)
+        return self._get_resource(self.device_url, 'device-model', params, only_names, fields,
+                                  server_fields=False)
 
-        resp = self._make_request(method="GET", url=self.device_url, params=params)
-        resp = self._get_names(resp, 'device-model') if only_names else resp
-        return resp
-
-    def get_advertiser(self, ids=None, one_id=None, search_term=None, only_names=True, **kwargs):
+    def get_advertiser(self, ids=None, one_id=None, search_term=None, only_names=True, fields=None, **kwargs):
         params = BaseAPI._get_params(ids=ids, one_id=one_id, search_term=search_term, **kwargs)
-        resp = self._make_request(method="GET", url=self.advertiser_url,
-                                  params=params)
-        resp = self._get_names(resp, 'advertiser') if only_names else resp
-        return resp
+        return self._get_resource(self.advertiser_url, 'advertiser', params, only_names, fields)
 
-    def get_line_item(self, ids=None, one_id=None, advertiser_id=None, only_names=True, **kwargs):
+    def get_line_item(self, ids=None, one_id=None, advertiser_id=None, only_names=True, fields=None, **kwargs):
         params = BaseAPI._get_params(ids=ids, one_id=one_id, advertiser_id=advertiser_id, **kwargs)
-        resp = self._make_request(method="GET", url=self.line_item_url, params=params)
-        resp = self._get_names(resp, 'line-item') if only_names else resp
-
-        return resp
+        return self._get_resource(self.line_item_url, 'line-item', params, only_names, fields)
 
     def get_insertion_order(self, ids=None, one_id=None, advertiser_id=None, search_term=None, only_names=True,
-                            **kwargs):
+                            fields=None, **kwargs):
         params = BaseAPI._get_params(ids=ids, one_id=one_id,
                                      advertiser_id=advertiser_id, search_term=search_term, **kwargs)
-        resp = self._make_request(method="GET", url=self.insertion_order_url, params=params)
-        resp = self._get_names(resp, 'insertion-order') if only_names else resp
+        return self._get_resource(self.insertion_order_url, 'insertion-order', params, only_names, fields)
 
-        return resp
-
-    def get_publisher(self, ids=None, one_id=None, only_names=True, **kwargs):
+    def get_publisher(self, ids=None, one_id=None, only_names=True, fields=None, **kwargs):
         params = BaseAPI._get_params(ids=ids, one_id=one_id, **kwargs)
-        resp = self._make_request(method="GET", url=self.publisher_url, params=params)
-        resp = self._get_names(resp, 'publisher') if only_names else resp
-        return resp
+        return self._get_resource(self.publisher_url, 'publisher', params, only_names, fields)
 
     def get_resold_inventory(self, type='publisher', category_type=None, ids=None,
-                             one_id=None, only_names=True, **kwargs):
+                             one_id=None, only_names=True, fields=None, **kwargs):
         params = BaseAPI._get_params(ids=ids, one_id=one_id, **kwargs)
         params.update({'type': type})
         if category_type:
             params['category_type'] = category_type
-        resp = self._make_request(method="GET", url=self.inventory_resold_url, params=params)
-        resp = self._get_names(resp, 'inventory-resold') if only_names else resp
-        return resp
+        return self._get_resource(self.inventory_resold_url, 'inventory-resold', params, only_names, fields,
+                                  server_fields=False)
 
     def get_creative(self, ids=None, one_id=None, advertiser_id=None, publisher_id=None,
-                     publisher_code=None, code=None, only_names=True, **kwargs):
+                     publisher_code=None, code=None, only_names=True, fields=None, **kwargs):
         params = BaseAPI._get_params(ids=ids, one_id=one_id, advertiser_id=advertiser_id,
                                      publisher_id=publisher_id, publisher_code=publisher_code,
                                      code=code, **kwargs)
-        resp = self._make_request(method="GET", url=self.creative_url, params=params)
-        resp = self._get_names(resp, 'creative') if only_names else resp
-        return resp
+        return self._get_resource(self.creative_url, 'creative', params, only_names, fields)
 
-    def get_operating_system(self, one_id=None, search_term=None, only_names=True, **kwargs):
+    def get_operating_system(self, one_id=None, search_term=None, only_names=True, fields=None, **kwargs):
         params = BaseAPI._get_params(one_id=one_id, search_term=search_term, **kwargs)
-        resp = self._make_request(method="GET", url=self.operating_system, params=params)
-        resp = self._get_names(resp, 'operating-system') if only_names else resp
-        return resp
+        return self._get_resource(self.operating_system, 'operating-system', params, only_names, fields,
+                                  server_fields=False)
 
-    def get_browser(self, one_id=None, search_term=None, only_names=True, **kwargs):
+    def get_browser(self, one_id=None, search_term=None, only_names=True, fields=None, **kwargs):
         params = BaseAPI._get_params(one_id=one_id, search_term=search_term, **kwargs)
-        resp = self._make_request(method="GET", url=self.browser_url, params=params)
-        resp = self._get_names(resp, 'browser') if only_names else resp
-        return resp
+        return self._get_resource(self.browser_url, 'browser', params, only_names, fields,
+                                  server_fields=False)
 
-    def get_country(self, one_id=None, name=None, code=None, only_names=True, **kwargs):
+    def get_country(self, one_id=None, name=None, code=None, only_names=True, fields=None, **kwargs):
         params = BaseAPI._get_params(one_id=one_id, country_code=code, name=name, **kwargs)
-        resp = self._make_request(method="GET", url=self.country_url, params=params)
-        resp = self._get_names(resp, 'country') if only_names else resp
-        return resp
+        return self._get_resource(self.country_url, 'country', params, only_names, fields,
+                                  server_fields=False)
 
-    def get_operating_system_extended(self, one_id=None, search_term=None, only_names=True, **kwargs):
+    def get_operating_system_extended(self, one_id=None, search_term=None, only_names=True, fields=None,
+                                      **kwargs):
         params = BaseAPI._get_params(one_id=one_id, search_term=search_term, **kwargs)
-        resp = self._make_request(method="GET", url=self.operating_system_extended, params=params)
-        resp = self._get_names(resp, 'operating-systems-extended') if only_names else resp
-        return resp
-
-    def get_change_log(self, service='campaign', resource_id=None, only_names=True, **kwargs):
+        return self._get_resource(self.operating_system_extended, 'operating-systems-extended', params,
+                                  only_names, fields, server_fields=False)
+
+    def get_change_log(self, service='campaign', resource_id=None, only_names=True, fields=None,
+                       empty_ok=False, **kwargs):
+        """
+        :param empty_ok: return an empty result instead of raising `NoTransactionDataError`
+                         when there is no change for the resource
+        """
         params = BaseAPI._get_params(resource_id=resource_id, service=service, **kwargs)
-        resp = self._make_request(method="GET", url=self.change_log_url, params=params)
-        resp = self._get_names(resp, 'change-log') if only_names else resp
-        return resp
+        try:
+            return self._get_resource(self.change_log_url, 'change-log', params, only_names, fields,
+                                      server_fields=False)
+        except NoTransactionDataError:
+            if not empty_ok:
+                raise
+            return {} if only_names else {'count': 0}
 
     def get_change_log_detail(self, service='campaign', resource_id=None, only_names=True,
-                              transaction_id=None, **kwargs):
+                              transaction_id=None, fields=None, empty_ok=False, **kwargs):
+        """
+        :param empty_ok: return an empty result instead of raising `NoTransactionDataError`
+                         when there is no data for the transaction
+        """
         params = BaseAPI._get_params(resource_id=resource_id, service=service, transaction_id=transaction_id, **kwargs)
-        resp = self._make_request(method="GET", url=self.change_log_detail_url, params=params)
-        resp = self._get_names(resp, 'change-log-detail') if only_names else resp
-        return resp
+        try:
+            return self._get_resource(self.change_log_detail_url, 'change-log-detail', params, only_names, fields,
+                                      server_fields=False)
+        except NoTransactionDataError:
+            if not empty_ok:
+                raise
+            return {} if only_names else {'count': 0}
 
     def get_city(self, country_code=None, country_name=None, dma_id=None, dma_name=None, one_id=None,
-                 name=None, only_names=True, **kwargs):
+                 name=None, only_names=True, fields=None, **kwargs):
         params = BaseAPI._get_params(country_code=country_code, country_name=country_name, dma_id=dma_id,
                                      dma_name=dma_name, one_id=one_id, name=name, **kwargs)
-        resp = self._make_request(method="GET", url=self.city_url, params=params)
-        resp = self._get_names(resp, 'city') if only_names else resp
-        return resp
+        return self._get_resource(self.city_url, 'city', params, only_names, fields,
+                                  server_fields=False)
 
     def get_segment(self, one_id=None, ids=None, advertiser_id=None, advertiser_code=None, code=None,
-                    only_names=True, **kwargs):
+                    only_names=True, fields=None, **kwargs):
         params = BaseAPI._get_params(ids=ids, one_id=one_id,
                                      advertiser_id=advertiser_id, code=code,
                                      advertiser_code=advertiser_code, **kwargs)
-        resp = self._make_request(method="GET", url=self.segment_url,
-                                  params=params)
-        resp = self._get_names(resp, 'segment') if only_names else resp
-        return resp
+        return self._get_resource(self.segment_url, 'segment', params, only_names, fields,
+                                  name_fields=('id', 'short_name'))
+
+    def iter_campaigns(self, **kwargs):
+        """ Lazy iteration over the campaigns, cf `BaseAPI.iter_all` for the arguments """
+        return self.iter_all(self.get_campaign, 'campaign', **kwargs)
+
+    def iter_pixels(self, **kwargs):
+        return self.iter_all(self.get_pixel, 'pixel', **kwargs)
+
+    def iter_devices(self, **kwargs):
+        return self.iter_all(self.get_device, 'device-model', **kwargs)
+
+    def iter_advertisers(self, **kwargs):
+        return self.iter_all(self.get_advertiser, 'advertiser', **kwargs)
+
+    def iter_line_items(self, **kwargs):
+        return self.iter_all(self.get_line_item, 'line-item', **kwargs)
+
+    def iter_insertion_orders(self, **kwargs):
+        return self.iter_all(self.get_insertion_order, 'insertion-order', **kwargs)
+
+    def iter_publishers(self, **kwargs):
+        return self.iter_all(self.get_publisher, 'publisher', **kwargs)
+
+    def iter_resold_inventory(self, **kwargs):
+        return self.iter_all(self.get_resold_inventory, 'inventory-resold', **kwargs)
+
+    def iter_creatives(self, **kwargs):
+        return self.iter_all(self.get_creative, 'creative', **kwargs)
+
+    def iter_operating_systems(self, **kwargs):
+        return self.iter_all(self.get_operating_system, 'operating-system', **kwargs)
+
+    def iter_browsers(self, **kwargs):
+        return self.iter_all(self.get_browser, 'browser', **kwargs)
+
+    def iter_countries(self, **kwargs):
+        return self.iter_all(self.get_country, 'country', **kwargs)
+
+    def iter_operating_systems_extended(self, **kwargs):
+        return self.iter_all(self.get_operating_system_extended, 'operating-systems-extended', **kwargs)
+
+    def iter_change_logs(self, **kwargs):
+        return self.iter_all(self.get_change_log, 'change-log', **kwargs)
+
+    def iter_cities(self, **kwargs):
+        return self.iter_all(self.get_city, 'city', **kwargs)
+
+    def iter_segments(self, **kwargs):
+        return self.iter_all(self.get_segment, 'segment', **kwargs)
 
     def add_segment(self, segment):
         resp = self._make_request(method="POST", url=self.segment_url,
@@ -1,18 +1,16 @@
+import functools
 import logging
 import time
-import requests
 import math
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 
-from . import logs
-from .ve_utils import get_chunks, is_notebook
-
-if is_notebook():
-    from tqdm import tqdm_notebook as tqdm_list
-    from tqdm import tnrange as trange
-else:
-    from tqdm import tqdm as tqdm_list
-    from tqdm import trange
+from . import logs, metrics, scheduling
+from .coalesce import RequestCoalescer
+from .containers import NameTable, RecordTable
+from .transport import RequestsTransport
+from .progress import progress, check_backend
+from .ve_utils import get_chunks
 
 
 class InvalidLoginError(Exception):
@@ -54,29 +52,67 @@ class BaseAPI(object):
     auth_url_adnx = "{}/auth".format(base_url_adnxs)
 
     max_elems =100
+    # seconds to wait after a RATE_EXCEEDED error and between two polls of a job
+    rate_limit_sleep = 60
+    poll_interval = 2
 
     def __init__(self, username, password, session=None, max_retry=10, timeout=5,
-                 sleep_time=None, verbose=False):
+                 sleep_time=None, verbose=False, coalesce_window=None,
+                 hooks=None, progress_backend=None, rate_limiter=None, token=None, scheduler=None,
+                 hedger=None, circuit_breaker=None, transport=None):
         """ The API time out @ ~ 15 min
         :param username: the AppNexus API username
         :param password: the AppNexus API password
-        :param session: a requests.Session() to use
+        :param session: a requests.Session() to use (for the default transport)
         :param max_retry: the number of times the API will try to complete the request if not successful
         :param timeout: timeout is second
         :param verbose: run in verbose mode
         :param sleep_time: sleep_time between each requests
+        :param coalesce_window: if set, the single-id lookups made concurrently within this delay (in seconds)
+                                on the same service are merged into one request
+        :param hooks: functions called with a `metrics.RequestEvent` after each call (on top of the hooks
+                      registered with `metrics.add_hook`)
+        :param progress_backend: how the progress of the loops is reported: 'none', 'tqdm' or a callback
+                                 (desc, n, total). Defaults to the global backend
+                                 (cf `progress.set_progress_backend`)
+        :param rate_limiter: a `ratelimit.RateLimiter` to acquire before each request
+        :param token: an authentication token to use instead of signing-in
+        :param scheduler: a `scheduling.RequestScheduler` giving the permits to send the requests by priority,
+                          shared by the clients using the same credentials (replaces `rate_limiter`)
+        :param hedger: a `resilience.Hedger` sending again the GET requests slower than the p95 of their endpoint
+        :param circuit_breaker: a `resilience.CircuitBreaker` failing fast (CircuitOpenError) the requests
+                                of the endpoints failing repeatedly
+        :param transport: the transport sending the requests (cf `transport`), default: a `RequestsTransport`
+                          of `session`. Can be shared by many clients, whatever their credentials.
         """
         self.user = {"username": username, "password": password}
-        self.session = session or requests.Session()
+        self.transport = transport or RequestsTransport(session)
         self.max_retry = max_retry
         self.sleep_time = sleep_time
         self.timeout = timeout
         self._verbose = verbose
+        self.hooks = list(hooks or [])
+        if progress_backend is not None:
+            check_backend(progress_backend)
+        self.progress_backend = progress_backend
+        self.rate_limiter = rate_limiter
+        self.scheduler = scheduler
+        self.hedger = hedger
+        self.circuit_breaker = circuit_breaker
+        self.token = None
+        self._coalescer = RequestCoalescer(coalesce_window, self.max_elems) if coalesce_window else None
 
         if not self._verbose:
             logging.getLogger("requests").setLevel(logging.WARNING)
 
         self._member_id = None
+        if token:
+            self.set_token(token)
+
+    @property
+    def session(self):
+        """The requests.Session of the default transport"""
+        return getattr(self.transport, 'session', None)
 
     @property
     def member_id(self):
@@ -103,6 +139,30 @@ class BaseAPI(object):
         :param kwargs: kwargs for requests
         :return:
         """
+        stats = {'retries': 0, 'rate_limit_wait': 0., 'auth_refreshes': 0, 'resp': None}
+        hooks = metrics.active_hooks(self.hooks)
+        if not hooks:
+            return self._send_request(stats, is_json, max_retry, *args, **kwargs)
+
+        t0, error = time.perf_counter(), None
+        try:
+            return self._send_request(stats, is_json, max_retry, *args, **kwargs)
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            resp = stats['resp']
+            metrics.emit(hooks, metrics.RequestEvent(
+                endpoint=metrics.endpoint_of(kwargs.get('url', '')), method=kwargs.get('method', 'GET'),
+                status=resp.status_code if resp is not None else None, latency=time.perf_counter() - t0,
+                retries=stats['retries'], bytes=len(resp.content) if resp is not None else 0,
+                rate_limit_wait=stats['rate_limit_wait'], auth_refreshes=stats['auth_refreshes'], error=error))
+
+    def _send_request(self, stats, is_json=True, max_retry=None, *args, **kwargs):
+        """Send the request, retrying and signing-in if necessary (cf `_make_request`)
+
+        :param stats: dict where are recorded the retries, waits and auth refreshes
+        """
         resp = None
         max_retry = max_retry or self.max_retry
 
@@ -110,12 +170,16 @@ class BaseAPI(object):
             time.sleep(self.sleep_time)
 
         for i in range(1, max_retry):
+            if i > 1:
+                stats['retries'] += 1
+            stats['rate_limit_wait'] += self._acquire()
             try:
-                resp = self.session.request(timeout=self.timeout, *args, **kwargs)
-            except (requests.Timeout, requests.ConnectionError) as e:
+                resp = self._request(*args, **kwargs)
+            except self.transport.transient_errors as e:
                 logs.logger.warning('(%s)... retrying (%d/%d)' % (e.args[0], i + 1, max_retry))
                 time.sleep(2 * max_retry)
             else:
+                stats['resp'] = resp
                 try:
                     response = resp.json()['response']
                 except KeyError:
@@ -126,12 +190,17 @@ class BaseAPI(object):
                         raise InvalidLoginError('Login is not a valid one')
                     elif response['error_id'] == 'NOAUTH':
                         url = self.base_url if self.base_url in kwargs['url'] else self.base_url_adnxs
-                        _ = self._make_request(method='POST', url="{}/auth".format(url),
-                                               json={"auth": self.user})
+                        stats['auth_refreshes'] += 1
+                        self.authenticate("{}/auth".format(url))
                     elif response.get('error_code') == 'RATE_EXCEEDED':
-                        logs.logger.warning('%s...  sleeping 60sec, retrying (%d/%d)' % (response['error'],
-                                                                                         i + 1, max_retry))
-                        time.sleep(60)
+                        logs.logger.warning('%s...  sleeping %dsec, retrying (%d/%d)' % (
+                            response['error'], self.rate_limit_sleep, i + 1, max_retry))
+                        if self.scheduler:
+                            # all the requests wait, the retry waits for the next permit
+                            self.scheduler.pause(self.rate_limit_sleep)
+                        else:
+                            stats['rate_limit_wait'] += self.rate_limit_sleep
+                            time.sleep(self.rate_limit_sleep)
                     else:
                         if response.get('error_message') == 'no transaction data is found':
                             raise NoTransactionDataError('No data found')
@@ -144,35 +213,127 @@ class BaseAPI(object):
 
         return resp.json()['response'] if is_json else resp
 
-    def _download_file(self, url, path=None, chunk_size=1024, file_size=None):
+    def _acquire(self):
+        """Wait for the permit to send a request, returns the time waited"""
+        if self.scheduler:
+            return self.scheduler.acquire()
+        if self.rate_limiter:
+            return self.rate_limiter.acquire()
+        return 0.
+
+    def _request(self, *args, **kwargs):
+        """Send one attempt of a request, through the circuit breaker and hedged if it is a GET"""
+        kwargs['headers'] = self._headers(kwargs.get('headers'))
+        send = functools.partial(self.transport.request, *args, timeout=self.timeout, **kwargs)
+        if not self.hedger and not self.circuit_breaker:
+            return send()
+
+        endpoint = metrics.endpoint_of(kwargs.get('url', ''))
+        if self.circuit_breaker:
+            self.circuit_breaker.before(endpoint)
+
+        # the second request waits for its own permit, with the class of the caller (it runs in the pool of the hedger)
+        @scheduling.bind
+        def send_hedge():
+            self._acquire()
+            return send()
+
+        try:
+            if self.hedger and kwargs.get('method', 'GET').upper() == 'GET':
+                resp = self.hedger.call(endpoint, send, send_hedge)
+            else:
+                resp = send()
+        except BaseException:
+            # whatever the error, a half-open circuit must not wait for its probe forever
+            if self.circuit_breaker:
+                self.circuit_breaker.failure(endpoint)
+            raise
+
+        if self.circuit_breaker:
+            if resp.status_code >= 500:
+                self.circuit_breaker.failure(endpoint)
+            else:
+                self.circuit_breaker.success(endpoint)
+        return resp
+
+    def authenticate(self, url=None):
+        """Sign-in to the API, the token received is used for the next requests
+
+        :param url: the auth url (default: `auth_url`)
+        :return: the token
+        """
+        resp = self._make_request(method='POST', url=url or self.auth_url, json={"auth": self.user})
+        self.set_token(resp.get('token'))
+        return self.token
+
+    def set_token(self, token):
+        """Use `token` to authenticate the next requests (ex: a token shared by another client)"""
+        self.token = token
+
+    def _headers(self, headers=None):
+        """The headers of a request of the client: `headers` and its token, the transport may be shared"""
+        if not self.token:
+            return headers
+        return dict(headers or {}, Authorization=self.token)
+
+    def _download_file(self, url, path=None, chunk_size=64 * 1024, file_size=None, sink=None):
         """Download the file at the given `url` and write it to `path`
 
         :param url: url of the file to download
         :param path: path where to write the file, is None specified, writes to BytesIO
         :param chunk_size: how much of the content to read per iteration
         :param file_size: the size of the file (in bytes)
+        :param sink: file-like object to write the chunks to instead of `path`, left open
 
-        :return: BytesIO if no path is specified otherwise nothing
+        :return: the sink if given, BytesIO if no path is specified otherwise nothing
         """
-        response = self.session.get(url, stream=True)
+        hooks = metrics.active_hooks(self.hooks)
+        t0, size = time.perf_counter(), 0
+
+        response = self.transport.stream(url, headers=self._headers())
         if response.status_code != 200:
+            # the body is read so that the connection goes back to the pool
+            response.content
+            response.close()
             return response
 
         file_size = file_size or response.headers.get('Content-Length')
         total = math.floor(float(file_size) / chunk_size) if file_size else 1
 
-        f = open(path, 'wb') if path else BytesIO()
+        if sink is not None:
+            f = sink
+        else:
+            f = open(path, 'wb') if path else BytesIO()
 
-        for chunk in tqdm_list(response.iter_content(chunk_size=chunk_size),
-                               total=total, leave=False, desc='file'):
+        for chunk in self._progress(response.iter_content(chunk_size=chunk_size),
+                                    total=total, leave=False, desc='file'):
             if chunk:
                 f.write(chunk)
+                size += len(chunk)
 
-        if not isinstance(f, BytesIO):
+        if sink is None and not isinstance(f, BytesIO):
             f.close()
 
+        if hooks:
+            metrics.emit(hooks, metrics.RequestEvent(
+                endpoint=metrics.endpoint_of(url), method='GET', status=response.status_code,
+                latency=time.perf_counter() - t0, retries=0, bytes=size, rate_limit_wait=0.,
+                auth_refreshes=0, error=None))
+
+        if sink is not None:
+            return sink
         return f if not path else None
 
+    def _progress(self, iterable, **kwargs):
+        """Report the progress of `iterable` with the backend of the client (cf `progress.progress`)"""
+        return progress(iterable, backend=self.progress_backend, **kwargs)
+
+    @staticmethod
+    def _progress_of(func, iterable, **kwargs):
+        """Report the progress of `iterable` with the backend of the client `func` is bound to"""
+        return progress(iterable, backend=getattr(getattr(func, '__self__', None), 'progress_backend', None),
+                        **kwargs)
+
     def load_member_id(self):
         resp = self._make_request(url="{}/member".format(self.base_url), method='GET')
         self._member_id = resp['member']['id']
@@ -247,6 +408,90 @@ class BaseAPI(object):
 
         return params
 
+    def _get_resource(self, url, key, params, only_names=True, fields=None,
+                      server_fields=True, name_fields=('id', 'name')):
+        """
+        GET a resource, projecting the objects on `fields` to reduce the payload
+
+        :param url: url of the service
+        :param key: the key of the objects in the response
+        :param params: the parameters of the request (see `_get_params`)
+        :param only_names: returns only the mapping id -> name
+        :param fields: list of the fields to keep in the objects
+        :param server_fields: the service supports the `fields` parameter, if not
+                              the projection is done once the response is received
+        :param name_fields: the fields to request when `only_names` is set
+        :return:
+        """
+        if only_names and not fields:
+            fields = name_fields
+        if isinstance(fields, str):
+            fields = fields.split(',')
+
+        if self._coalescer and set(params) == {'id'} and ',' not in str(params['id']):
+            fetch = functools.partial(self._get_batch, url, key, only_names, fields, server_fields)
+            batch_key = (url, key, only_names, tuple(fields or ()), server_fields)
+            return self._coalescer.submit(batch_key, params['id'], fetch).result()
+
+        if fields and server_fields:
+            params['fields'] = ','.join(fields)
+
+        resp = self._make_request(method="GET", url=url, params=params)
+
+        if only_names:
+            return self._get_names(resp, key)
+        if fields and not server_fields:
+            resp = self._project_fields(resp, key, fields)
+        return resp
+
+    def _get_batch(self, url, key, only_names, fields, server_fields, ids):
+        """
+        GET the objects `ids` in one request and split the response per id,
+        each id getting what a single-id request would have returned
+
+        :return: dict id (as str) -> result
+        """
+        params = {'id': ','.join(ids)}
+        if fields and server_fields:
+            params['fields'] = ','.join(fields if 'id' in fields else list(fields) + ['id'])
+
+        resp = self._make_request(method="GET", url=url, params=params)
+        objects = self._get_objects(resp, key)
+
+        if only_names:
+            results = {x: {} for x in ids}
+            results.update({str(x['id']): {x['id']: x.get('name') or x.get('short_name')} for x in objects})
+            return results
+
+        meta = {k: v for k, v in resp.items() if k not in (key, "{}s".format(key))}
+        results = {x: dict(meta, count=0) for x in ids}
+        for obj in objects:
+            obj_id = str(obj['id'])
+            if fields:
+                obj = {f: obj[f] for f in fields if f in obj}
+            results[obj_id] = dict(meta, count=1, **{key: obj})
+        return results
+
+    @staticmethod
+    def _get_objects(response, key):
+        """
+        Extract the list of objects from a response
+        :param response:
+        :param key:
+        :return:
+        """
+        # some services name their objects with underscores (ex: 'change_logs' for 'change-log')
+        for k in (key, key.replace('-', '_')):
+            key_plural = "{}s".format(k)
+
+            if key_plural in response:
+                return response[key_plural] or []
+            elif k in response:
+                if isinstance(response[k], list):
+                    return response[k]
+                return [response[k]] if response[k] else []
+        return []
+
     @staticmethod
     def _get_names(response, key):
         """
@@ -255,40 +500,84 @@ class BaseAPI(object):
         :param key:
         :return:
         """
-        names = {}
+        return {x['id']: x.get('name') or x.get('short_name') for x in BaseAPI._get_objects(response, key)}
 
-        key_plural = "{}s".format(key)
-
-        if key_plural in response:
-            names = {x['id']: x.get('name') or x.get('short_name') for x in response[key_plural]}
-        elif key in response:
-            if isinstance(response[key], list):
-                names = {x['id']: x.get('name') or x.get('short_name') for x in response[key]}
-            else:
-                names = {response[key]['id']: response[key].get('name') or response[key].get('short_name')}
-        else:
-            pass
-        return names
+    @staticmethod
+    def _project_fields(response, key, fields):
+        """
+        Keep only `fields` in the objects of a response (client-side equivalent of the `fields` parameter)
+        :param response:
+        :param key:
+        :param fields: list of the fields to keep
+        :return:
+        """
+        for k in ("{}s".format(key), key):
+            if k not in response:
+                continue
+            objects = response[k]
+            if isinstance(objects, list):
+                response[k] = [{f: x[f] for f in fields if f in x} for x in objects]
+            elif isinstance(objects, dict):
+                response[k] = {f: objects[f] for f in fields if f in objects}
+            break
+        return response
 
     @staticmethod
-    def bulk_requests(func, ids, **kwargs):
+    @scheduling.priority(scheduling.BULK)
+    def bulk_requests(func, ids, fields=None, compact=False, **kwargs):
         """
         Given a list of ids, make as many requests as necessary to get a matching for all the ids
         as we are limited by 100 items per answer.
 
         :param func:
         :param ids:
+        :param fields: list of the fields to return for each object
+        :param compact: return a NameTable (or a RecordTable of the objects if `only_names=False`)
+                        instead of a dict (or the list of the responses)
         :return:
         """
         not_only_names = kwargs.get('only_names') is False
-        data = {} if not not_only_names else []
-        for id_chunk in tqdm_list(get_chunks(ids, 100), total=math.ceil(len(ids) / 100)):
+        if fields:
+            kwargs['fields'] = fields
+        data = BaseAPI._results(not not_only_names, compact)
+        for id_chunk in BaseAPI._progress_of(func, get_chunks(ids, 100), total=math.ceil(len(ids) / 100)):
             res = func(ids=id_chunk, **kwargs)
-            data.update(res) if not not_only_names else data.append(res)
+            BaseAPI._add_results(data, res)
         return data
 
     @staticmethod
-    def bulk_request_get_all(func, only_names=True, limit=None, **kwargs):
+    def _results(only_names, compact):
+        """The container of the results of the bulk requests"""
+        if compact:
+            return NameTable() if only_names else RecordTable()
+        return {} if only_names else []
+
+    @staticmethod
+    def _add_results(results, response):
+        if isinstance(results, (dict, NameTable)):
+            results.update(response)
+        elif isinstance(results, RecordTable):
+            results.extend(BaseAPI._find_objects(response))
+        else:
+            results.append(response)
+
+    @staticmethod
+    def _find_objects(response):
+        """
+        Extract the list of objects from a response whose key is unknown
+        :param response:
+        :return:
+        """
+        for value in response.values():
+            if isinstance(value, list) and value and isinstance(value[0], dict):
+                return value
+            if isinstance(value, dict) and 'id' in value:
+                return [value]
+        return []
+
+    @staticmethod
+    @scheduling.priority(scheduling.BULK)
+    def bulk_request_get_all(func, only_names=True, limit=None, fields=None, compact=False, **kwargs):
         """
         Get all the results available using pagination for a given call that may returns
         more than 100 results
@@ -296,30 +585,81 @@ class BaseAPI(object):
         :param func: the get function
         :param only_names: returns only names or not
         :param limit: limit for the number of calls
+        :param fields: list of the fields to return for each object
+        :param compact: return a NameTable (or a RecordTable of the objects if not `only_names`)
+                        instead of a dict (or the list of the responses)
         :param kwargs: arguments to pass to the get function
         :return:
         """
-        resp = func(**kwargs, start_element=0, num_elements=1, only_names=False)
+        resp = func(**kwargs, start_element=0, num_elements=1, only_names=False, fields=['id'])
 
         count = resp['count']
         logs.logger.info('%d elements found' % count)
         total_calls = math.ceil(count / BaseAPI.max_elems)
 
-        results = {} if only_names else []
-        for i in trange(0, total_calls):
+        results = BaseAPI._results(only_names, compact)
+        for i in BaseAPI._progress_of(func, range(0, total_calls)):
 
             if limit and i >= limit:
                 logs.logger.info('\t%d/%d, breaking loop' % (i, limit))
                 break
 
-            res = func(**kwargs, only_names=only_names,
+            res = func(**kwargs, only_names=only_names, fields=fields,
                        start_element=i * BaseAPI.max_elems, num_elements=BaseAPI.max_elems)
 
-            if isinstance(results, dict):
-                results.update(res)
-            else:
-                results.append(res)
+            BaseAPI._add_results(results, res)
 
         return results
 
+    def iter_all(self, func, key, start_element=0, num_elements=None, only_names=False, fields=None,
+                 prefetch=True, **kwargs):
+        """
+        Iterate over all the objects of a paginated collection. The objects are yielded as the pages
+        arrive and the next page is fetched in the background while the current one is consumed.
+
+        Stopping the iteration does not fetch any further page. To resume, pass as `start_element`
+        the initial `start_element` plus the number of objects already consumed.
 
+        :param func: the get function
+        :param key: the key of the objects in the response
+        :param start_element: the position of the first object to get
+        :param num_elements: the number of objects per page (default and maximum: `max_elems`)
+        :param only_names: yield (id, name) tuples instead of the objects
+        :param fields: list of the fields to return for each object
+        :param prefetch: fetch the next page while the current one is consumed
+        :param kwargs: arguments to pass to the get function
+        :return: generator of the objects
+        """
+        # the API returns at most `max_elems` objects per page, a shorter page must mean the last one
+        num_elements = min(num_elements or self.max_elems, self.max_elems)
+
+        # the pages are fetched as bulk requests, in this thread or the prefetching one
+        @scheduling.priority(scheduling.BULK, scheduling.current()[1])
+        def fetch(start):
+            return func(**kwargs, start_element=start, num_elements=num_elements,
+                        only_names=only_names, fields=fields)
+
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        future = None
+        try:
+            page = fetch(start_element)
+            while True:
+                objects = list(page.items()) if only_names else self._get_objects(page, key)
+                count = None if only_names else page.get('count')
+                next_start = start_element + len(objects)
+                has_next = bool(objects) and (next_start < count if count is not None
+                                              else len(objects) >= num_elements)
+
+                future = executor.submit(fetch, next_start) if has_next and executor else None
+                for obj in objects:
+                    yield obj
+
+                if not has_next:
+                    break
+                page = future.result() if future else fetch(next_start)
+                future, start_element = None, next_start
+        finally:
+            if future:
+                future.cancel()
+            if executor:
+                executor.shutdown(wait=False)
@@ -1 +1,2 @@
-from .api import BonsaiAPI
\ No newline at end of file
+from .api import BonsaiAPI
+from .tree import BonsaiModel, BonsaiSyntaxError, validate_model
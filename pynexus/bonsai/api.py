@@ -1,17 +1,64 @@
 import base64
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from ..api import BaseAPI
+from ..base_api import InvalidParamsError
 from .. import logs
+from .tree import validate_model
+
+UNCHANGED, CREATED, MODIFIED, INVALID, FAILED = 'unchanged', 'created', 'modified', 'invalid', 'failed'
 
 
 class BonsaiAPI(BaseAPI):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, cache_path=None, local_validation=False, model_limits=None, **kwargs):
+        """
+        :param cache_path: json file where to keep the validation results and the hashes of the
+                           deployed models between two runs (in memory only if None)
+        :param local_validation: check the syntax and the size of the models locally (cf `tree`)
+                                 and only send the ones passing to the API parser
+        :param model_limits: dict overriding the size limits of `tree.LIMITS`
+        """
         super().__init__(*args, **kwargs)
+        self.cache_path = cache_path
+        self.local_validation = local_validation
+        self.model_limits = model_limits
+        self._cache_lock = threading.Lock()
+        self._cache = {'validated': {}, 'deployed': {}}
+        self._models_index = None
+
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path) as f:
+                self._cache.update(json.load(f))
+
+    @staticmethod
+    def model_hash(model_str):
+        return hashlib.sha256(model_str.encode('utf-8')).hexdigest()
+
+    def _save_cache(self):
+        if not self.cache_path:
+            return
+        with self._cache_lock:
+            with open(self.cache_path, 'w') as f:
+                json.dump(self._cache, f)
 
     def get_models(self):
         r = self._make_request(method="GET", url='%s/custom-model' % self.base_url)
         return r['custom_models']
 
+    def get_models_index(self, refresh=False):
+        """
+        The models by name, fetched once and kept up to date by the uploads
+        :param refresh: fetch the models again
+        :return: dict name -> model
+        """
+        if self._models_index is None or refresh:
+            self._models_index = {x['name']: x for x in self.get_models()}
+        return self._models_index
+
     def get_model(self, model_id):
         params = {'id': model_id}
         r = self._make_request(method="GET", url='%s/custom-model' % self.base_url, params=params)
@@ -28,17 +75,19 @@ class BonsaiAPI(BaseAPI):
             logs.logger.error("{error_code}: {error}".format(**response))
         except KeyError:
             logs.logger.info("Status: %s" % response['status'])
+            if self._models_index is not None:
+                self._models_index[model_name] = dict(model['custom_model'], id=response.get('id'))
 
-    def modify_model(self, model_name, member_id, advertiser_id, model_str):
+    def modify_model(self, model_name, member_id, advertiser_id, model_str, model_output='bid_modifier'):
         logs.logger.info("1. Validating the model")
-        model = self.get_model_checked(model_name, member_id, advertiser_id, model_str)
+        model = self.get_model_checked(model_name, member_id, advertiser_id, model_output, model_str)
         if not model:
             return
         logs.logger.info("2. Uploading new model to '%s'" % model_name)
 
         try:
-            model_id = [x['id'] for x in self.get_models() if x['name'] == model_name][0]
-        except IndexError:
+            model_id = self.get_models_index()[model_name]['id']
+        except KeyError:
             logs.logger.error("Model name '%s' not found" % model_name)
             return
         params = {'id': model_id}
@@ -48,6 +97,70 @@ class BonsaiAPI(BaseAPI):
         except KeyError:
             logs.logger.info("Status: %s" % response['status'])
 
+    def deploy_models(self, models, max_workers=8, refresh_index=False):
+        """
+        Validate and upload many models concurrently. A model whose text did not change since
+        its last deployment is neither validated nor uploaded again.
+
+        :param models: list of dict with the keys `model_name`, `member_id`, `advertiser_id`,
+                       `model_str` and optionally `model_output` (default: 'bid_modifier')
+        :param max_workers: number of models validated and uploaded at the same time
+        :param refresh_index: fetch the existing models again instead of using the cached index
+        :return: dict model_name -> status ('unchanged', 'created', 'modified', 'invalid' or 'failed')
+        """
+        index = self.get_models_index(refresh=refresh_index)
+
+        def deploy(model):
+            name, model_output = model['model_name'], model.get('model_output', 'bid_modifier')
+            model_hash = self.model_hash('%s|%s|%s|%s' % (model['member_id'], model['advertiser_id'],
+                                                          model_output, model['model_str']))
+            if name in index and self._cache['deployed'].get(name) == model_hash:
+                return name, UNCHANGED
+
+            checked = self.get_model_checked(name, model['member_id'], model['advertiser_id'],
+                                             model_output, model['model_str'])
+            if not checked:
+                return name, INVALID
+
+            try:
+                if name in index:
+                    response = self._make_request(method='PUT', url='%s/custom-model' % self.base_url,
+                                                  params={'id': index[name]['id']}, json=checked)
+                    status = MODIFIED
+                else:
+                    response = self._make_request(method='POST', url='%s/custom-model' % self.base_url,
+                                                  json=checked)
+                    status = CREATED
+            except Exception as e:
+                # the other models are deployed all the same
+                logs.logger.error("[%s] upload failed: %s: %s" % (name, type(e).__name__, e))
+                return name, FAILED
+
+            if 'error_code' in response:
+                logs.logger.error("[%s] %s: %s" % (name, response['error_code'], response.get('error')))
+                return name, FAILED
+
+            if status == CREATED:
+                index[name] = dict(checked['custom_model'], id=response.get('id'))
+            with self._cache_lock:
+                self._cache['deployed'][name] = model_hash
+            return name, status
+
+        def deploy_checked(model):
+            try:
+                return deploy(model)
+            except Exception as e:
+                logs.logger.error("[%s] %s: %s" % (model['model_name'], type(e).__name__, e))
+                return model['model_name'], FAILED
+
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                results = dict(executor.map(deploy_checked, models))
+        finally:
+            # the hashes of the models deployed are kept whatever happened to the others
+            self._save_cache()
+        return results
+
     def delete_model(self, model_id):
         params = {"id": model_id}
         r = self._make_request(method='DELETE', url='%s/custom-model' % self.base_url, params=params)
@@ -58,13 +171,47 @@ class BonsaiAPI(BaseAPI):
 
     def check_model(self, model_str):
         model = base64.b64encode(model_str.encode('utf-8')).decode('utf-8')
+        model_hash = self.model_hash(model_str)
+        if model_hash in self._cache['validated']:
+            return self._cache['validated'][model_hash], model
+
+        if self.local_validation:
+            validation = validate_model(model_str, self.model_limits)
+            if not validation.is_valid:
+                logs.logger.error("Invalid model: %s" % '; '.join(validation.errors))
+                return False, model
+
         data = {'custom-model-parser': {'model_text': model}}
-        response = self._make_request(method='POST', url='%s/custom-model-parser' % self.base_url, json=data)
         try:
-            logs.logger.error("Invalid model: {error_code} - {error}".format(**response))
+            response = self._make_request(method='POST', url='%s/custom-model-parser' % self.base_url, json=data)
+        except InvalidParamsError as e:
+            # the parser errors come with an error_id, like the server errors (SYSTEM...): not cached
+            logs.logger.error("Invalid model: %s" % e)
             return False, model
+
+        try:
+            logs.logger.error("Invalid model: {error_code} - {error}".format(**response))
+            is_valid = False
         except KeyError:
-            return True, model
+            is_valid = True
+
+        with self._cache_lock:
+            self._cache['validated'][model_hash] = is_valid
+        return is_valid, model
+
+    def check_models(self, models_str, max_workers=8):
+        """
+        Validate many models concurrently
+        :param models_str: list of the models text
+        :param max_workers: number of models validated at the same time
+        :return: list of (is_valid, base64 model)
+        """
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                results = list(executor.map(self.check_model, models_str))
+        finally:
+            self._save_cache()
+        return results
 
     def get_model_checked(self, model_name, member_id, advertiser_id, model_output, model_str):
         is_valid, model = self.check_model(model_str)
@@ -0,0 +1,625 @@
+"""
+Local parser and evaluator for the Bonsai decision tree language, to check the models before
+sending them to `/custom-model-parser` and to simulate their output offline.
+
+Supported syntax:
+
+    # comment
+    if every segment[123], segment[456].age <= 180:
+        if country in ("US", "CA"):
+            leaf_name: "north_america"
+            value: 1.5
+        elif user_hour range (9, 17):
+            0.8
+        else:
+            no_bid
+    elif not (domain = "example.com" or os_family absent):
+        switch region:
+            case ("US:NY", "US:CA"):
+                2
+            default:
+                1
+    else:
+        1
+
+Conditions: `feature`, `feature <op> value` (=, ==, !=, <, <=, >, >=), `feature in (...)`,
+`feature range (min, max)` (bounds included), `feature absent`, `every a, b`, `any a, b`,
+`not`, `and`, `or` and parentheses. A feature is a name optionally followed by `[key]`
+and `.attribute` (ex: `segment[123].age`).
+"""
+import re
+from collections import namedtuple
+
+# default limits, override them to match the ones of your seat
+LIMITS = {
+    'max_bytes': 3 * 1024 * 1024,
+    'max_leaves': 65536,
+    'max_depth': 256,
+}
+
+NO_BID = 'no_bid'
+
+ModelStats = namedtuple('ModelStats', ['size', 'encoded_size', 'nodes', 'leaves', 'depth'])
+Validation = namedtuple('Validation', ['is_valid', 'errors', 'warnings', 'stats'])
+Scores = namedtuple('Scores', ['values', 'leaves'])
+
+
+class BonsaiSyntaxError(Exception):
+    """
+    raised when a model is not a valid Bonsai tree
+    """
+    def __init__(self, message, lineno=None):
+        super().__init__('line %d: %s' % (lineno, message) if lineno else message)
+        self.lineno = lineno
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError('numpy is required to evaluate Bonsai models: pip install numpy')
+    return numpy
+
+
+# ---- conditions ----
+
+class Feature(namedtuple('Feature', ['name', 'key', 'attribute'])):
+    """A feature of the tree, `name[key].attribute`, named in the data by `str(feature)`"""
+    __slots__ = ()
+
+    def __str__(self):
+        key = '[%s]' % self.key if self.key is not None else ''
+        attribute = '.%s' % self.attribute if self.attribute else ''
+        return '%s%s%s' % (self.name, key, attribute)
+
+
+def _column(features, feature, np):
+    column = features.get(str(feature))
+    return None if column is None else np.asarray(column)
+
+
+def _present(column, np):
+    if column.dtype.kind == 'b':
+        return column
+    if column.dtype.kind in 'iu':
+        return column != 0
+    if column.dtype.kind in 'fc':
+        return (column != 0) & ~np.isnan(column)
+    return np.array([x is not None and x == x and x != '' and x is not False for x in column], dtype=bool)
+
+
+class Test(namedtuple('Test', ['feature', 'op', 'operand'])):
+    """Test on one feature. `op` is None for a presence test"""
+    __slots__ = ()
+
+    def evaluate(self, features, n, np):
+        column = _column(features, self.feature, np)
+        if self.op == 'absent':
+            return np.ones(n, dtype=bool) if column is None else ~_present(column, np)
+        if column is None:
+            return np.zeros(n, dtype=bool)
+        if self.op is None:
+            return _present(column, np)
+
+        with np.errstate(invalid='ignore'):
+            if self.op == 'in':
+                return np.isin(column, list(self.operand))
+            if self.op == 'range':
+                low, high = self.operand
+                return (column >= low) & (column <= high)
+            if self.op in ('=', '=='):
+                return column == self.operand
+            if self.op == '!=':
+                return column != self.operand
+            if self.op == '<':
+                return column < self.operand
+            if self.op == '<=':
+                return column <= self.operand
+            if self.op == '>':
+                return column > self.operand
+            return column >= self.operand
+
+
+class Not(namedtuple('Not', ['condition'])):
+    __slots__ = ()
+
+    def evaluate(self, features, n, np):
+        return ~self.condition.evaluate(features, n, np)
+
+
+class All(namedtuple('All', ['conditions'])):
+    __slots__ = ()
+
+    def evaluate(self, features, n, np):
+        result = np.ones(n, dtype=bool)
+        for condition in self.conditions:
+            result &= condition.evaluate(features, n, np)
+        return result
+
+
+class Any(namedtuple('Any', ['conditions'])):
+    __slots__ = ()
+
+    def evaluate(self, features, n, np):
+        result = np.zeros(n, dtype=bool)
+        for condition in self.conditions:
+            result |= condition.evaluate(features, n, np)
+        return result
+
+
+# ---- nodes ----
+
+Leaf = namedtuple('Leaf', ['index', 'value', 'name', 'lineno'])
+If = namedtuple('If', ['branches', 'default', 'lineno'])
+Switch = namedtuple('Switch', ['feature', 'cases', 'default', 'lineno'])
+
+
+_TOKEN_RE = re.compile(r'''\s*(?:
+    (?P<number>-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)
+  | (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+  | (?P<op><=|>=|==|!=|=|<|>)
+  | (?P<punct>[()\[\],.:])
+  | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+)''', re.VERBOSE)
+
+_Token = namedtuple('_Token', ['kind', 'value'])
+_Line = namedtuple('_Line', ['indent', 'text', 'lineno'])
+
+
+def _tokenize(text, lineno):
+    tokens, pos = [], 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = _TOKEN_RE.match(text, pos)
+        if not match or match.end() == pos:
+            raise BonsaiSyntaxError('unexpected character %r' % text[pos:].strip()[:1], lineno)
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'number':
+            value = float(value) if any(c in value for c in '.eE') else int(value)
+        elif kind == 'string':
+            value = value[1:-1].replace('\\"', '"').replace("\\'", "'")
+        tokens.append(_Token(kind, value))
+        pos = match.end()
+    return tokens
+
+
+def _strip_comment(line):
+    quote = None
+    for i, c in enumerate(line):
+        if quote:
+            if c == quote and line[i - 1] != '\\':
+                quote = None
+        elif c in '"\'':
+            quote = c
+        elif c == '#':
+            return line[:i]
+    return line
+
+
+class _ConditionParser(object):
+    """Recursive descent parser of the tokens of a condition"""
+
+    def __init__(self, tokens, lineno):
+        self.tokens = tokens
+        self.pos = 0
+        self.lineno = lineno
+
+    def error(self, message):
+        raise BonsaiSyntaxError(message, self.lineno)
+
+    def peek(self, offset=0):
+        pos = self.pos + offset
+        return self.tokens[pos] if pos < len(self.tokens) else _Token(None, None)
+
+    def next(self):
+        token = self.peek()
+        if token.kind is None:
+            self.error('unexpected end of condition')
+        self.pos += 1
+        return token
+
+    def accept(self, value, kind=None):
+        token = self.peek()
+        if token.value == value and token.kind in ((kind,) if kind else ('name', 'punct', 'op')):
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, value):
+        if not self.accept(value):
+            found = self.peek().value if self.peek().kind else 'end of condition'
+            self.error("expected '%s', found '%s'" % (value, found))
+
+    def parse(self):
+        condition = self.parse_or()
+        if self.peek().kind is not None:
+            self.error("unexpected '%s' in condition" % self.peek().value)
+        return condition
+
+    def parse_or(self):
+        conditions = [self.parse_and()]
+        while self.accept('or', 'name'):
+            conditions.append(self.parse_and())
+        return conditions[0] if len(conditions) == 1 else Any(tuple(conditions))
+
+    def parse_and(self):
+        conditions = [self.parse_not()]
+        while self.accept('and', 'name'):
+            conditions.append(self.parse_not())
+        return conditions[0] if len(conditions) == 1 else All(tuple(conditions))
+
+    def parse_not(self):
+        if self.accept('not', 'name'):
+            return Not(self.parse_not())
+        return self.parse_primary()
+
+    def parse_primary(self):
+        if self.accept('every', 'name'):
+            return All(tuple(self.parse_list(self.parse_test)))
+        if self.accept('any', 'name'):
+            return Any(tuple(self.parse_list(self.parse_test)))
+        if self.accept('(', 'punct'):
+            condition = self.parse_or()
+            self.expect(')')
+            return condition
+        return self.parse_test()
+
+    def parse_list(self, parse_item):
+        items = [parse_item()]
+        while self.accept(',', 'punct'):
+            items.append(parse_item())
+        return items
+
+    def parse_value(self):
+        token = self.next()
+        if token.kind in ('number', 'string'):
+            return token.value
+        if token.kind == 'name' and token.value in ('true', 'false'):
+            return token.value == 'true'
+        self.error("expected a value, found '%s'" % token.value)
+
+    def parse_values(self):
+        if self.accept('(', 'punct'):
+            values = self.parse_list(self.parse_value)
+            self.expect(')')
+            return tuple(values)
+        return (self.parse_value(),)
+
+    def parse_feature(self):
+        token = self.next()
+        if token.kind != 'name' or token.value in ('and', 'or', 'not', 'in', 'range', 'every', 'any'):
+            self.error("expected a feature, found '%s'" % token.value)
+        name, key, attribute = token.value, None, None
+        if self.accept('[', 'punct'):
+            key = self.parse_value()
+            self.expect(']')
+        if self.accept('.', 'punct'):
+            token = self.next()
+            if token.kind != 'name':
+                self.error("expected an attribute after '.', found '%s'" % token.value)
+            attribute = token.value
+        return Feature(name, key, attribute)
+
+    def parse_test(self):
+        feature = self.parse_feature()
+
+        token = self.peek()
+        if token.kind == 'op':
+            self.pos += 1
+            return Test(feature, token.value, self.parse_value())
+        if self.accept('in', 'name'):
+            return Test(feature, 'in', self.parse_values())
+        if self.accept('range', 'name'):
+            self.expect('(')
+            low = self.parse_value()
+            self.expect(',')
+            high = self.parse_value()
+            self.expect(')')
+            return Test(feature, 'range', (low, high))
+        if self.accept('absent', 'name'):
+            return Test(feature, 'absent', None)
+        return Test(feature, None, None)
+
+
+class BonsaiModel(object):
+    """
+    A parsed Bonsai tree
+
+    Usage:
+        model = BonsaiModel.parse(model_str)
+        model.validate().is_valid
+        model.evaluate({'country': countries, 'segment[123].age': ages}).values
+    """
+
+    def __init__(self, root, leaves, text):
+        self.root = root
+        self.leaves = leaves
+        self.text = text
+        self.warnings = []
+
+    @classmethod
+    def parse(cls, text):
+        """
+        Parse the text of a model
+        :raise BonsaiSyntaxError: if the model is not valid
+        :return: BonsaiModel
+        """
+        return _TreeParser(text).parse()
+
+    # ---- statistics ----
+
+    def stats(self):
+        nodes, depth = self._count(self.root, 1)
+        size = len(self.text.encode('utf-8'))
+        return ModelStats(size=size, encoded_size=4 * ((size + 2) // 3), nodes=nodes,
+                          leaves=len(self.leaves), depth=depth)
+
+    def _count(self, node, depth):
+        if isinstance(node, Leaf):
+            return 1, depth
+        children = self._children(node)
+        counts = [self._count(child, depth + 1) for child in children]
+        return 1 + sum(x[0] for x in counts), max(x[1] for x in counts)
+
+    @staticmethod
+    def _children(node):
+        if isinstance(node, If):
+            children = [x[1] for x in node.branches]
+        else:
+            children = [x[1] for x in node.cases]
+        return children + ([node.default] if node.default is not None else [])
+
+    def validate(self, limits=None):
+        """
+        Check the model against the size limits
+        :param limits: dict overriding `LIMITS`
+        :return: Validation
+        """
+        limits = dict(LIMITS, **(limits or {}))
+        stats = self.stats()
+        errors = []
+        if stats.encoded_size > limits['max_bytes']:
+            errors.append('model too large: %d bytes once encoded (max %d)' % (stats.encoded_size,
+                                                                              limits['max_bytes']))
+        if stats.leaves > limits['max_leaves']:
+            errors.append('too many leaves: %d (max %d)' % (stats.leaves, limits['max_leaves']))
+        if stats.depth > limits['max_depth']:
+            errors.append('tree too deep: %d (max %d)' % (stats.depth, limits['max_depth']))
+        return Validation(not errors, errors, list(self.warnings), stats)
+
+    # ---- evaluation ----
+
+    def evaluate(self, features, n=None):
+        """
+        Score rows, vectorized over NumPy arrays
+
+        :param features: mapping feature -> array of values, one per row (a pandas DataFrame works).
+                         The features are named as in the model: 'country', 'segment[123]',
+                         'segment[123].age'... A missing feature is absent for all the rows.
+        :param n: number of rows, if no feature is provided
+        :return: Scores: `values` (float, NaN for no_bid or when no leaf is reached) and `leaves`
+                 (index in `self.leaves` of the leaf reached, -1 if none)
+        """
+        np = _numpy()
+        if n is None:
+            n = len(next(iter(features.values()))) if len(features) else 1
+
+        values = np.full(n, np.nan)
+        leaves = np.full(n, -1, dtype=np.int64)
+        self._evaluate(self.root, np.ones(n, dtype=bool), features, n, np, values, leaves)
+        return Scores(values, leaves)
+
+    def evaluate_row(self, row):
+        """Score one row given as a dict feature -> value. Returns the value (None for no_bid or no leaf)"""
+        np = _numpy()
+        scores = self.evaluate({k: np.array([v], dtype=object if isinstance(v, str) else None)
+                                for k, v in row.items()}, n=1)
+        value = scores.values[0]
+        return None if np.isnan(value) else float(value)
+
+    def _evaluate(self, node, mask, features, n, np, values, leaves):
+        if not mask.any():
+            return
+        if isinstance(node, Leaf):
+            values[mask] = np.nan if node.value is None else node.value
+            leaves[mask] = node.index
+            return
+
+        remaining = mask.copy()
+        if isinstance(node, If):
+            for condition, child in node.branches:
+                selected = remaining & condition.evaluate(features, n, np)
+                self._evaluate(child, selected, features, n, np, values, leaves)
+                remaining &= ~selected
+        else:
+            column = _column(features, node.feature, np)
+            for case_values, child in node.cases:
+                if column is None:
+                    break
+                selected = remaining & np.isin(column, list(case_values))
+                self._evaluate(child, selected, features, n, np, values, leaves)
+                remaining &= ~selected
+
+        if node.default is not None:
+            self._evaluate(node.default, remaining, features, n, np, values, leaves)
+
+
+class _TreeParser(object):
+    """Parser of the lines of a model, based on their indentation"""
+
+    def __init__(self, text):
+        self.text = text
+        self.lines = []
+        for lineno, line in enumerate(text.splitlines(), 1):
+            line = _strip_comment(line).rstrip()
+            if not line.strip():
+                continue
+            stripped = line.lstrip()
+            indent = len(line[:len(line) - len(stripped)].expandtabs(4))
+            self.lines.append(_Line(indent, stripped, lineno))
+        self.pos = 0
+        self.leaves = []
+        self.warnings = []
+
+    def peek(self):
+        return self.lines[self.pos] if self.pos < len(self.lines) else None
+
+    def next(self):
+        line = self.peek()
+        self.pos += 1
+        return line
+
+    def parse(self):
+        if not self.lines:
+            raise BonsaiSyntaxError('empty model')
+        root = self.parse_node(self.lines[0].indent)
+        if self.peek():
+            raise BonsaiSyntaxError('unexpected statement after the end of the tree', self.peek().lineno)
+        model = BonsaiModel(root, self.leaves, self.text)
+        model.warnings = self.warnings
+        return model
+
+    @staticmethod
+    def keyword(line):
+        match = re.match(r'[A-Za-z_]+', line.text)
+        return match.group(0) if match else None
+
+    def parse_node(self, indent):
+        line = self.peek()
+        if line.indent != indent:
+            raise BonsaiSyntaxError('unexpected indentation', line.lineno)
+
+        keyword = self.keyword(line)
+        if keyword == 'if':
+            return self.parse_if(indent)
+        if keyword == 'switch':
+            return self.parse_switch(indent)
+        if keyword in ('elif', 'else', 'case', 'default'):
+            raise BonsaiSyntaxError("'%s' without a matching statement" % keyword, line.lineno)
+        return self.parse_leaf(indent)
+
+    def parse_body(self, line):
+        """Parse the subtree below the header `line`"""
+        body = self.peek()
+        if body is None or body.indent <= line.indent:
+            raise BonsaiSyntaxError('expected an indented block', line.lineno)
+        node = self.parse_node(body.indent)
+        following = self.peek()
+        if following is not None and following.indent > line.indent:
+            raise BonsaiSyntaxError('only one statement is allowed in a block', following.lineno)
+        return node
+
+    def header(self, line, keyword):
+        """The condition of a `keyword ...:` line"""
+        if not line.text.endswith(':'):
+            raise BonsaiSyntaxError("expected ':' at the end of the line", line.lineno)
+        return line.text[len(keyword):-1].strip()
+
+    def parse_condition(self, text, lineno):
+        if not text:
+            raise BonsaiSyntaxError('missing condition', lineno)
+        return _ConditionParser(_tokenize(text, lineno), lineno).parse()
+
+    def parse_if(self, indent):
+        line = self.next()
+        branches = [(self.parse_condition(self.header(line, 'if'), line.lineno), self.parse_body(line))]
+        default = None
+
+        while self.peek() and self.peek().indent == indent and self.keyword(self.peek()) == 'elif':
+            line = self.next()
+            branches.append((self.parse_condition(self.header(line, 'elif'), line.lineno), self.parse_body(line)))
+
+        if self.peek() and self.peek().indent == indent and self.keyword(self.peek()) == 'else':
+            line = self.next()
+            if self.header(line, 'else'):
+                raise BonsaiSyntaxError("'else' does not take a condition", line.lineno)
+            default = self.parse_body(line)
+        return If(tuple(branches), default, line.lineno)
+
+    def parse_switch(self, indent):
+        line = self.next()
+        parser = _ConditionParser(_tokenize(self.header(line, 'switch'), line.lineno), line.lineno)
+        test = parser.parse_test()
+        if test.op is not None or parser.peek().kind is not None:
+            raise BonsaiSyntaxError('switch expects a feature', line.lineno)
+
+        cases, default = [], None
+        case_indent = self.peek().indent if self.peek() else None
+        if case_indent is None or case_indent <= indent:
+            raise BonsaiSyntaxError('expected an indented block', line.lineno)
+
+        while self.peek() and self.peek().indent == case_indent:
+            case = self.next()
+            keyword = self.keyword(case)
+            if keyword == 'case' and default is None:
+                parser = _ConditionParser(_tokenize(self.header(case, 'case'), case.lineno), case.lineno)
+                values = parser.parse_values()
+                if parser.peek().kind is not None:
+                    raise BonsaiSyntaxError("unexpected '%s' in case" % parser.peek().value, case.lineno)
+                cases.append((values, self.parse_body(case)))
+            elif keyword == 'default' and default is None:
+                if self.header(case, 'default'):
+                    raise BonsaiSyntaxError("'default' does not take a value", case.lineno)
+                default = self.parse_body(case)
+            else:
+                raise BonsaiSyntaxError("expected 'case' or 'default' in switch", case.lineno)
+
+        if not cases:
+            raise BonsaiSyntaxError('switch without case', line.lineno)
+        return Switch(test.feature, tuple(cases), default, line.lineno)
+
+    def parse_leaf_value(self, text, lineno):
+        if text == NO_BID:
+            return None
+        if text.startswith('compute'):
+            self.warnings.append('line %d: compute() leaves are not evaluated locally' % lineno)
+            return None
+        tokens = _tokenize(text, lineno)
+        if len(tokens) != 1 or tokens[0].kind != 'number':
+            raise BonsaiSyntaxError("invalid leaf value '%s'" % text, lineno)
+        return float(tokens[0].value)
+
+    def parse_leaf(self, indent):
+        first = self.peek()
+        name, value, has_value = None, None, False
+
+        while self.peek() and self.peek().indent == indent:
+            line = self.peek()
+            key, sep, rest = line.text.partition(':')
+            key = key.strip()
+            if sep and key == 'leaf_name' and name is None:
+                tokens = _tokenize(rest, line.lineno)
+                if len(tokens) != 1 or tokens[0].kind != 'string':
+                    raise BonsaiSyntaxError('leaf_name expects a string', line.lineno)
+                name = tokens[0].value
+            elif sep and key == 'value' and not has_value:
+                value, has_value = self.parse_leaf_value(rest.strip(), line.lineno), True
+            elif not sep and not has_value and name is None:
+                value, has_value = self.parse_leaf_value(line.text.strip(), line.lineno), True
+                self.next()
+                break
+            else:
+                break
+            self.next()
+
+        if not has_value:
+            raise BonsaiSyntaxError("expected a leaf value or a statement, found '%s'" % first.text, first.lineno)
+
+        leaf = Leaf(len(self.leaves), value, name, first.lineno)
+        self.leaves.append(leaf)
+        return leaf
+
+
+def validate_model(model_str, limits=None):
+    """
+    Check the syntax and the size of a model without calling the API
+    :param model_str: the text of the model
+    :param limits: dict overriding `LIMITS`
+    :return: Validation
+    """
+    try:
+        model = BonsaiModel.parse(model_str)
+    except BonsaiSyntaxError as e:
+        return Validation(False, [str(e)], [], None)
+    return model.validate(limits)
@@ -0,0 +1,235 @@
+"""
+Export of the change logs of AppNexus objects (https://wiki.appnexus.com/display/api/Change+Log+Service)
+
+    exporter = ChangeLogExporter(AppNexusAPI(**APPNEXUS_ACCOUNT), max_workers=8, rate=5)
+    exporter.export('changes.jsonl', services=['campaign', 'line-item'], advertiser_id=1234)
+
+The resources are enumerated, then their change logs and the details of each transaction are
+fetched concurrently and the changes are written as they arrive, one record per transaction.
+"""
+import copy
+import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from . import scheduling
+from .ratelimit import RateLimiter
+
+# the AppNexusAPI iterator of the resources of each service
+SERVICES = {
+    'campaign': 'iter_campaigns',
+    'line-item': 'iter_line_items',
+    'insertion-order': 'iter_insertion_orders',
+    'advertiser': 'iter_advertisers',
+    'creative': 'iter_creatives',
+    'segment': 'iter_segments',
+    'pixel': 'iter_pixels',
+    'publisher': 'iter_publishers',
+}
+
+RECORD_FIELDS = ['service', 'resource_id', 'transaction_id', 'method', 'user_id', 'user_full_name',
+                 'created_on', 'changes']
+
+
+def normalize_change(service, resource_id, entry, detail=None):
+    """
+    A flat record for one transaction of the change log
+    :param service: the service of the resource
+    :param resource_id: the id of the resource
+    :param entry: the transaction, as returned by the change-log service
+    :param detail: the response of the change-log-detail service for the transaction
+    :return: dict with the keys of `RECORD_FIELDS`
+    """
+    changes = []
+    if detail:
+        details = detail.get('change_log_details') or detail.get('change-log-details') or \
+            detail.get('change_log_detail') or detail.get('change-log-detail') or {}
+        if isinstance(details, list):
+            for item in details:
+                changes.extend(item.get('changes') or [])
+        else:
+            changes = details.get('changes') or []
+
+    return {
+        'service': service,
+        'resource_id': resource_id,
+        'transaction_id': entry.get('transaction_id'),
+        'method': entry.get('method'),
+        'user_id': entry.get('user_id'),
+        'user_full_name': entry.get('user_full_name'),
+        'created_on': entry.get('created_on'),
+        'changes': [{'field': x.get('field'), 'old_value': x.get('old_value'), 'new_value': x.get('new_value')}
+                    for x in changes],
+    }
+
+
+class JsonLinesWriter(object):
+    """Writes one json record per line"""
+
+    def __init__(self, path):
+        self._file = open(path, 'w')
+
+    def write(self, record):
+        self._file.write(json.dumps(record, default=str))
+        self._file.write('\n')
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter(object):
+    """Writes the records in row groups of `batch_size` records, `changes` being stored as json"""
+
+    def __init__(self, path, batch_size=10000):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError('pyarrow is required to write parquet files: pip install pyarrow')
+
+        self._pa = pyarrow
+        self._schema = pyarrow.schema([
+            ('service', pyarrow.string()), ('resource_id', pyarrow.int64()), ('transaction_id', pyarrow.string()),
+            ('method', pyarrow.string()), ('user_id', pyarrow.int64()), ('user_full_name', pyarrow.string()),
+            ('created_on', pyarrow.string()), ('changes', pyarrow.string())])
+        self._writer = pyarrow.parquet.ParquetWriter(path, self._schema)
+        self._batch = []
+        self.batch_size = batch_size
+
+    def write(self, record):
+        record = dict(record, changes=json.dumps(record['changes'], default=str),
+                      transaction_id=None if record['transaction_id'] is None else str(record['transaction_id']),
+                      created_on=None if record['created_on'] is None else str(record['created_on']))
+        self._batch.append(record)
+        if len(self._batch) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        if self._batch:
+            self._writer.write_table(self._pa.Table.from_pylist(self._batch, schema=self._schema))
+            self._batch = []
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+
+WRITERS = {'jsonl': JsonLinesWriter, 'parquet': ParquetWriter}
+
+
+class ChangeLogExporter(object):
+    """
+    Fetch the change logs of many resources concurrently and stream them as normalized records
+    """
+
+    def __init__(self, api, max_workers=8, rate=None, fetch_details=True):
+        """
+        :param api: the AppNexusAPI to use
+        :param max_workers: number of requests made at the same time
+        :param rate: maximum number of requests per second, if the api has no rate limiter yet
+        :param fetch_details: fetch the fields changed by each transaction (one request per transaction)
+        """
+        if rate and api.rate_limiter is None:
+            # the requests of the exporter are limited, not the ones made later with `api`
+            api = copy.copy(api)
+            api.rate_limiter = RateLimiter(rate)
+        self.api = api
+        self.max_workers = max_workers
+        self.fetch_details = fetch_details
+
+    def iter_resources(self, services, resource_ids=None, **filters):
+        """
+        The (service, resource_id) to export
+        :param services: list of services
+        :param resource_ids: dict service -> list of ids, the resources of the other services are enumerated
+        :param filters: filters of the enumeration (ex: advertiser_id=1234)
+        """
+        resource_ids = resource_ids or {}
+        for service in services:
+            if service in resource_ids:
+                for resource_id in resource_ids[service]:
+                    yield service, resource_id
+                continue
+            if service not in SERVICES:
+                raise ValueError("Unknown service '%s', give its resource_ids" % service)
+            for resource in getattr(self.api, SERVICES[service])(fields=['id'], **filters):
+                yield service, resource['id']
+
+    def _get_change_log(self, service, resource_id):
+        entries = list(self.api.iter_change_logs(service=service, resource_id=resource_id, empty_ok=True,
+                                                 prefetch=False))
+        return 'log', (service, resource_id, entries)
+
+    def _get_detail(self, service, resource_id, entry):
+        detail = self.api.get_change_log_detail(service=service, resource_id=resource_id,
+                                                transaction_id=entry.get('transaction_id'),
+                                                only_names=False, empty_ok=True)
+        return 'detail', normalize_change(service, resource_id, entry, detail)
+
+    def iter_changes(self, services=('campaign', 'line-item'), resource_ids=None, **filters):
+        """
+        Generator of the normalized changes (cf `normalize_change`), in the order they are received.
+        A resource without change simply yields nothing.
+
+        :param services: the services to export
+        :param resource_ids: dict service -> list of ids, the resources of the other services are enumerated
+        :param filters: filters of the enumeration of the resources (ex: advertiser_id=1234)
+        """
+        resources = self.iter_resources(services, resource_ids, **filters)
+        window = 2 * self.max_workers
+        pending = set()
+        # the transactions whose detail is still to fetch, submitted within the window like the change logs
+        details = deque()
+        get_change_log = scheduling.bind(self._get_change_log, scheduling.BULK)
+        get_detail = scheduling.bind(self._get_detail, scheduling.BULK)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                while details and len(pending) < window:
+                    pending.add(executor.submit(get_detail, *details.popleft()))
+
+                # the resources are enumerated as the change logs are fetched, once their details are
+                while resources is not None and not details and len(pending) < window:
+                    resource = next(resources, None)
+                    if resource is None:
+                        resources = None
+                        break
+                    pending.add(executor.submit(get_change_log, *resource))
+
+                if not pending:
+                    break
+
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    kind, payload = future.result()
+                    if kind == 'detail':
+                        yield payload
+                        continue
+
+                    service, resource_id, entries = payload
+                    for entry in entries:
+                        if self.fetch_details:
+                            details.append((service, resource_id, entry))
+                        else:
+                            yield normalize_change(service, resource_id, entry)
+
+    def export(self, path, services=('campaign', 'line-item'), resource_ids=None, output_format=None, **filters):
+        """
+        Write the changes to `path`
+        :param path: the output file
+        :param services: the services to export
+        :param resource_ids: dict service -> list of ids, the resources of the other services are enumerated
+        :param output_format: 'jsonl' or 'parquet', guessed from the extension of `path` if None
+        :param filters: filters of the enumeration of the resources (ex: advertiser_id=1234)
+        :return: the number of records written
+        """
+        output_format = output_format or ('parquet' if path.endswith('.parquet') else 'jsonl')
+        writer = WRITERS[output_format](path)
+        count = 0
+        try:
+            for record in self.iter_changes(services, resource_ids, **filters):
+                writer.write(record)
+                count += 1
+        finally:
+            writer.close()
+        return count
@@ -0,0 +1,219 @@
+"""
+Run batch jobs (reports and segment uploads) described in a manifest across a pool of processes.
+
+    pynexus-jobs manifest.json --workers 4 --rate 10
+
+Manifest (json):
+    {
+        "reports_folder": "reports",
+        "reports": {
+            "network_analytics": "network_analytics_fields",
+            "my_report": {"report": {"report_type": "...", "columns": [...]}}
+        },
+        "segments": [
+            {"segment_id": 123, "file": "users_123.txt", "member_id": 456}
+        ]
+    }
+
+A report is either the parameters of the report or the name of a report defined in
+`pynexus.reports.settings`. A segment file contains one user id per line. Relative paths
+are relative to the manifest.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from . import logs, progress
+from .base_api import BaseAPI
+from .ratelimit import RateLimiter
+from .settings import APPNEXUS_ACCOUNT
+
+Job = namedtuple('Job', ['kind', 'name', 'params'])
+JobResult = namedtuple('JobResult', ['kind', 'name', 'ok', 'duration', 'error', 'result'])
+
+REPORT, SEGMENT = 'report', 'segment'
+
+
+class _SharedToken(object):
+    """Authentication token shared between the processes"""
+
+    def __init__(self, token=None, size=1024):
+        self._value = multiprocessing.Array('c', size)
+        if token:
+            self.set(token)
+
+    def get(self):
+        return self._value.value.decode('utf-8') or None
+
+    def set(self, token):
+        self._value.value = token.encode('utf-8')
+
+
+_worker = {}
+
+
+def _init_worker(user, token, rate_limiter, client_kwargs):
+    _worker.update(user=user, token=token, rate_limiter=rate_limiter, client_kwargs=client_kwargs, clients={})
+    progress.set_progress_backend(progress.NONE)
+
+
+def _get_client(api_class):
+    clients = _worker['clients']
+    if api_class not in clients:
+        clients[api_class] = api_class(**_worker['user'], rate_limiter=_worker['rate_limiter'],
+                                       **_worker['client_kwargs'])
+
+    api = clients[api_class]
+    token = _worker['token'].get()
+    if token and token != api.token:
+        api.set_token(token)
+    return api
+
+
+def _run_report(job):
+    from .reports import ReportsAPI
+
+    api = _get_client(ReportsAPI)
+    params = job.params
+    os.makedirs(params['reports_folder'], exist_ok=True)
+    return api, api.save_report(job.name, params['report_fields'], params['reports_folder']).path
+
+
+def _run_segment(job):
+    from .segments import SegmentAPI
+    from .segments.upload import upload_segment, METRICS
+
+    api = _get_client(SegmentAPI)
+    params = job.params
+    with open(params['file']) as f:
+        user_ids = [x.strip() for x in f if x.strip()]
+    return api, upload_segment(params['segment_id'], user_ids, metrics=params.get('metrics', METRICS),
+                               member_id=params.get('member_id'), api=api)
+
+
+_RUNNERS = {REPORT: _run_report, SEGMENT: _run_segment}
+
+
+def run_job(job):
+    """Run `job` in a worker, never raises"""
+    t0 = time.time()
+    api = None
+    try:
+        api, result = _RUNNERS[job.kind](job)
+    except Exception as e:
+        return JobResult(job.kind, job.name, False, time.time() - t0, '%s: %s' % (type(e).__name__, e), None)
+    finally:
+        # the token may have been renewed by this worker, share it
+        if api is not None and api.token and api.token != _worker['token'].get():
+            _worker['token'].set(api.token)
+
+    return JobResult(job.kind, job.name, True, time.time() - t0, None, result)
+
+
+def load_jobs(manifest_path, reports_folder=None):
+    """
+    Read the jobs of a manifest
+    :param manifest_path: path of the json manifest
+    :param reports_folder: folder of the reports, overrides the one of the manifest
+    :return: list of Job
+    """
+    from .reports import settings as reports_settings
+
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+
+    root = os.path.dirname(os.path.abspath(manifest_path))
+    reports_folder = os.path.join(root, reports_folder or manifest.get('reports_folder') or '.')
+
+    jobs = []
+    for name, report_fields in manifest.get('reports', {}).items():
+        if isinstance(report_fields, str):
+            try:
+                report_fields = getattr(reports_settings, report_fields)
+            except AttributeError:
+                raise ValueError("Report '%s': unknown report definition '%s'" % (name, report_fields))
+        jobs.append(Job(REPORT, name, {'report_fields': report_fields, 'reports_folder': reports_folder}))
+
+    for segment in manifest.get('segments', []):
+        params = dict(segment, file=os.path.join(root, segment['file']))
+        jobs.append(Job(SEGMENT, segment.get('name') or 'segment_%s' % segment['segment_id'], params))
+
+    return jobs
+
+
+def run_jobs(jobs, user, workers=None, rate=None, client_kwargs=None):
+    """
+    Run the jobs across a pool of processes sharing one authentication token and one rate limit
+
+    :param jobs: list of Job
+    :param user: dict with the username and password
+    :param workers: number of processes (default: number of cpus)
+    :param rate: maximum number of requests per second for all the processes (no limit if None)
+    :param client_kwargs: other parameters for the clients
+    :return: list of JobResult, in the order of completion
+    """
+    token = _SharedToken(BaseAPI(**user).authenticate())
+    rate_limiter = RateLimiter(rate, shared=True) if rate else None
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(user, token, rate_limiter, client_kwargs or {})) as executor:
+        futures = [executor.submit(run_job, job) for job in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            status = 'done' if result.ok else 'FAILED (%s)' % result.error
+            logs.logger.info('[%s] %s: %s in %0.1fs' % (result.kind, result.name, status, result.duration))
+            results.append(result)
+    return results
+
+
+def summarize(results, elapsed, out=sys.stdout):
+    """Write the throughput, the failures and the duration of each job"""
+    failed = [x for x in results if not x.ok]
+    out.write('%d jobs, %d succeeded, %d failed in %0.1fs (%0.1f jobs/min)\n' % (
+        len(results), len(results) - len(failed), len(failed), elapsed,
+        60. * len(results) / elapsed if elapsed else 0.))
+
+    out.write('\n%-8s %-40s %-7s %10s\n' % ('kind', 'name', 'status', 'duration'))
+    for result in sorted(results, key=lambda x: -x.duration):
+        out.write('%-8s %-40s %-7s %9.1fs\n' % (result.kind, result.name, 'ok' if result.ok else 'FAILED',
+                                                 result.duration))
+    for result in failed:
+        out.write('\n[%s] %s: %s' % (result.kind, result.name, result.error))
+    if failed:
+        out.write('\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='pynexus-jobs', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('manifest', help='json file describing the jobs')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='number of processes')
+    parser.add_argument('-r', '--rate', type=float, default=None,
+                        help='maximum number of requests per second, for all the processes')
+    parser.add_argument('--reports-folder', help='folder where to write the reports')
+    parser.add_argument('--username', default=os.environ.get('APPNEXUS_USERNAME') or APPNEXUS_ACCOUNT['username'])
+    parser.add_argument('--password', default=os.environ.get('APPNEXUS_PASSWORD') or APPNEXUS_ACCOUNT['password'])
+    parser.add_argument('-v', '--verbose', action='store_true', help='log the progress of the jobs')
+    args = parser.parse_args(argv)
+
+    if args.verbose:
+        logs.setup_logging()
+
+    jobs = load_jobs(args.manifest, args.reports_folder)
+    user = {'username': args.username, 'password': args.password}
+
+    t0 = time.time()
+    results = run_jobs(jobs, user, workers=args.workers, rate=args.rate)
+    summarize(results, time.time() - t0)
+
+    return 0 if all(x.ok for x in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class _Batch(object):
+    """Pending lookups sharing the same request"""
+    def __init__(self, fetch):
+        self.fetch = fetch
+        self.items = []
+        self.ids = OrderedDict()
+        self.timer = None
+
+
+class RequestCoalescer(object):
+    """
+    Buffers the single-id lookups made on the same endpoint during `window` seconds
+    and resolves them with one batched request.
+    """
+
+    def __init__(self, window=0.005, max_batch=100):
+        """
+        :param window: how long (in seconds) a lookup waits for others to join its batch
+        :param max_batch: the maximum number of ids per request, a full batch is sent right away
+        """
+        self.window = window
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def submit(self, batch_key, item_id, fetch):
+        """
+        Add a lookup to the batch `batch_key`
+
+        :param batch_key: hashable identifying the lookups that can share a request
+        :param item_id: the id to look up
+        :param fetch: function called with the list of the ids of the batch (as str)
+                      returning a dict id (as str) -> result
+        :return: a `concurrent.futures.Future` resolved with the result of `item_id`
+        """
+        future = Future()
+        full_batch = None
+
+        with self._lock:
+            batch = self._pending.get(batch_key)
+            if batch is None:
+                batch = self._pending[batch_key] = _Batch(fetch)
+                batch.timer = threading.Timer(self.window, self._flush, args=(batch_key, batch))
+                batch.timer.daemon = True
+                batch.timer.start()
+
+            batch.items.append((str(item_id), future))
+            batch.ids[str(item_id)] = None
+
+            if len(batch.ids) >= self.max_batch:
+                del self._pending[batch_key]
+                batch.timer.cancel()
+                full_batch = batch
+
+        if full_batch:
+            self._run(full_batch)
+        return future
+
+    def _flush(self, batch_key, batch):
+        with self._lock:
+            if self._pending.get(batch_key) is not batch:
+                return
+            del self._pending[batch_key]
+        self._run(batch)
+
+    @staticmethod
+    def _run(batch):
+        try:
+            results = batch.fetch(list(batch.ids))
+        except Exception as e:
+            for _, future in batch.items:
+                future.set_exception(e)
+            return
+
+        for item_id, future in batch.items:
+            future.set_result(results.get(item_id))
@@ -0,0 +1,267 @@
+"""
+Compact containers for large catalogs (millions of segments, creatives...).
+
+A dict `{id: name}` or the raw pages of the responses cost a few hundred bytes per object.
+`NameTable` and `RecordTable` keep the numbers in arrays and the strings packed in one buffer
+per column, with the lookups of a dict:
+
+    names = AppNexusAPI.bulk_request_get_all(api.get_segment, compact=True)
+    names[1234]
+    segments = AppNexusAPI.bulk_request_get_all(api.get_segment, only_names=False, compact=True)
+    segments[1234]['short_name'], segments.column('member_id')
+"""
+from array import array
+from bisect import bisect_right
+from collections.abc import Mapping
+
+_INT64 = (-2 ** 63, 2 ** 63)
+
+
+def _is_int64(value):
+    return type(value) is int and _INT64[0] <= value < _INT64[1]
+
+
+class StringColumn(object):
+    """
+    Column of strings (or None) encoded in UTF-8 one after the other in a single buffer,
+    the strings are decoded when read
+    """
+    __slots__ = ('_data', '_ends', '_nulls')
+
+    def __init__(self, values=None):
+        self._data = bytearray()
+        self._ends = array('q')
+        self._nulls = set()
+        for value in values or ():
+            self.append(value)
+
+    def append(self, value):
+        if value is None:
+            self._nulls.add(len(self._ends))
+        else:
+            self._data += value.encode('utf-8')
+        self._ends.append(len(self._data))
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self._ends)
+        if i in self._nulls:
+            return None
+        start = self._ends[i - 1] if i else 0
+        return self._data[start:self._ends[i]].decode('utf-8')
+
+    def __len__(self):
+        return len(self._ends)
+
+    def __iter__(self):
+        for i in range(len(self._ends)):
+            yield self[i]
+
+
+def _column_for(value, size):
+    """An empty column able to store `value`, filled with None if `size` objects are already stored"""
+    if size:
+        return [None] * size
+    if _is_int64(value):
+        return array('q')
+    if type(value) is float:
+        return array('d')
+    if isinstance(value, str):
+        return StringColumn()
+    return []
+
+
+def _append(column, value):
+    """Append `value` to `column`, returns the column (a list if `value` does not fit in `column`)"""
+    kind = type(column)
+    if kind is list:
+        column.append(value)
+        return column
+    if kind is StringColumn:
+        if value is None or isinstance(value, str):
+            column.append(value)
+            return column
+    elif column.typecode == 'q':
+        if _is_int64(value):
+            column.append(value)
+            return column
+    elif type(value) is float:
+        column.append(value)
+        return column
+
+    column = list(column)
+    column.append(value)
+    return column
+
+
+def _sorted_index(keys):
+    """
+    The keys sorted and the position of each of them in `keys`, the last one for duplicated keys
+    :param keys: array or list of the keys, the None keys are left out
+    :return: (sorted keys, positions)
+    """
+    order = sorted((i for i in range(len(keys)) if keys[i] is not None), key=keys.__getitem__)
+    sorted_keys = array('q') if type(keys) is array else []
+    positions = array('q')
+    for i in order:
+        if positions and keys[i] == sorted_keys[-1]:
+            positions[-1] = i
+            continue
+        sorted_keys.append(keys[i])
+        positions.append(i)
+    return sorted_keys, positions
+
+
+def _find(index, key):
+    """Position of `key` in the column the `index` was built from, None if absent"""
+    sorted_keys, positions = index
+    try:
+        i = bisect_right(sorted_keys, key) - 1
+    except TypeError:
+        return None
+    if i >= 0 and sorted_keys[i] == key:
+        return positions[i]
+    return None
+
+
+class NameTable(Mapping):
+    """
+    Read-only mapping id -> name backed by an array of ids and a StringColumn of names.
+    It is filled with `update`, like the dicts it replaces. The ids which are not 64 bits integers
+    (ex: codes) are kept in a dict.
+    """
+
+    def __init__(self, items=None):
+        self._ids = array('q')
+        self._names = StringColumn()
+        self._others = {}
+        self._index = None
+        if items:
+            self.update(items)
+
+    def update(self, items):
+        """
+        Add the names of `items`, the last name of an id is kept
+        :param items: dict id -> name or iterable of (id, name)
+        """
+        if isinstance(items, Mapping):
+            items = items.items()
+        for id_, name in items:
+            if _is_int64(id_):
+                self._ids.append(id_)
+                self._names.append(name)
+            else:
+                self._others[id_] = name
+        self._index = None
+
+    def _get_index(self):
+        if self._index is None:
+            sorted_ids, positions = _sorted_index(self._ids)
+            if len(sorted_ids) != len(self._ids):
+                # drop the names overridden by a later update
+                self._names = StringColumn(self._names[i] for i in positions)
+                self._ids = sorted_ids
+                positions = array('q', range(len(sorted_ids)))
+            self._index = sorted_ids, positions
+        return self._index
+
+    def __getitem__(self, id_):
+        if not _is_int64(id_):
+            return self._others[id_]
+        position = _find(self._get_index(), id_)
+        if position is None:
+            raise KeyError(id_)
+        return self._names[position]
+
+    def __iter__(self):
+        yield from self._get_index()[0]
+        yield from self._others
+
+    def __len__(self):
+        return len(self._get_index()[0]) + len(self._others)
+
+    def __repr__(self):
+        return '<NameTable: %d names>' % len(self)
+
+
+class RecordTable(Mapping):
+    """
+    Read-only mapping id -> object stored by columns: arrays for the integer and float fields,
+    StringColumn for the strings and lists for the others. The objects are rebuilt as dicts on lookup.
+    """
+
+    def __init__(self, objects=None, key='id'):
+        """
+        :param objects: iterable of dicts
+        :param key: the field the objects are looked up by
+        """
+        self.key = key
+        self._columns = {}
+        self._size = 0
+        self._index = None
+        if objects:
+            self.extend(objects)
+
+    def extend(self, objects):
+        for obj in objects:
+            self.append(obj)
+
+    def append(self, obj):
+        columns = self._columns
+        for field, value in obj.items():
+            if field not in columns:
+                columns[field] = _column_for(value, self._size)
+
+        for field, column in columns.items():
+            new_column = _append(column, obj.get(field))
+            if new_column is not column:
+                columns[field] = new_column
+
+        self._size += 1
+        self._index = None
+
+    @property
+    def fields(self):
+        return list(self._columns)
+
+    def column(self, field):
+        """The values of `field` for all the objects (array for the numeric fields)"""
+        return self._columns[field]
+
+    def row(self, position):
+        """The object at `position` (in the order they were added)"""
+        return {field: column[position] for field, column in self._columns.items()}
+
+    def records(self):
+        """Generator of the objects, in the order they were added"""
+        for i in range(self._size):
+            yield self.row(i)
+
+    def _get_index(self):
+        if self._index is None:
+            keys = self._columns.get(self.key)
+            if keys is None:
+                self._index = array('q'), array('q')
+            else:
+                self._index = _sorted_index(keys if type(keys) is array else list(keys))
+        return self._index
+
+    def __getitem__(self, id_):
+        position = _find(self._get_index(), id_)
+        if position is None:
+            raise KeyError(id_)
+        return self.row(position)
+
+    def __iter__(self):
+        return iter(self._get_index()[0])
+
+    def __len__(self):
+        return len(self._get_index()[0])
+
+    def __repr__(self):
+        return '<RecordTable: %d objects, fields %s>' % (self._size, ', '.join(self._columns))
+
+    def to_frame(self):
+        """pandas DataFrame of the objects"""
+        import pandas as pd
+        return pd.DataFrame({field: list(column) for field, column in self._columns.items()})
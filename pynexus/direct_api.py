@@ -5,17 +5,13 @@ class AppNexusDirectAPI(BaseAPI):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-    def get_segment(self, member_id, segment_id=None, only_names=True, **kwargs):
+    def get_segment(self, member_id, segment_id=None, only_names=True, fields=None, **kwargs):
         """ https://wiki.appnexus.com/display/adnexusdocumentation/Segment+Service """
         params_url = "{}".format(member_id) if not segment_id else "{}/{}".format(member_id, segment_id)
         params = BaseAPI._get_params(**kwargs)
 
-        resp = self._make_request(method="GET",
-                                  url='{}/segment/{}'.format(self.base_url, params_url),
-                                  params=params)
-
-        resp = self._get_names(resp, 'segment') if only_names else resp
-        return resp
+        return self._get_resource('{}/segment/{}'.format(self.base_url, params_url), 'segment', params,
+                                  only_names, fields, name_fields=('id', 'short_name'))
 
     def add_segment(self, segment):
         """ cf https://wiki.appnexus.com/display/api/Segment+Service
@@ -1,19 +1,43 @@
 import logging
-import coloredlogs
 import os
 
 logger = logging.getLogger('pynexus')
-coloredlogs.install(level='INFO', fmt="%(asctime)s %(levelname)s %(message)s")
 
-if not logger.handlers:
-    logs_folder = os.path.join(os.path.dirname(__file__), '../tmp')
-    if not os.path.exists(logs_folder):
-        os.makedirs(logs_folder)
-
-    file_handler = logging.FileHandler('{}/pynexus.log'.format(logs_folder))
-    file_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    file_handler.setFormatter(file_format)
-    logger.addHandler(file_handler)
+LOG_FORMAT = "%(asctime)s %(levelname)s %(message)s"
+FILE_LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+def setup_logging(level='INFO', log_file=None, colored=True):
+    """
+    Configure the logging of pynexus. Nothing is configured at import time, so call it
+    to get the logs in the console (colored if `coloredlogs` is installed) and in a file.
+
+    :param level: the logging level
+    :param log_file: path of a file to write the logs to (no file if None)
+    :param colored: use coloredlogs for the console
+    :return: the pynexus logger
+    """
+    logger.setLevel(level)
+
+    try:
+        if not colored:
+            raise ImportError()
+        import coloredlogs
+    except ImportError:
+        if not any(type(h) is logging.StreamHandler for h in logger.handlers):
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter(LOG_FORMAT))
+            logger.addHandler(handler)
+    else:
+        coloredlogs.install(level=level, fmt=LOG_FORMAT, logger=logger)
+
+    if log_file and not any(isinstance(h, logging.FileHandler) and h.baseFilename == os.path.abspath(log_file)
+                            for h in logger.handlers):
+        file_handler = logging.FileHandler(log_file)
+        file_handler.setFormatter(logging.Formatter(FILE_LOG_FORMAT))
+        logger.addHandler(file_handler)
+
+    return logger
 
 
 class NullLoger(object):
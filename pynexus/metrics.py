@@ -0,0 +1,197 @@
+import bisect
+import threading
+from collections import namedtuple, defaultdict
+from urllib.parse import urlsplit
+
+from . import logs
+
+RequestEvent = namedtuple('RequestEvent', ['endpoint', 'method', 'status', 'latency', 'retries', 'bytes',
+                                           'rate_limit_wait', 'auth_refreshes', 'error'])
+RequestEvent.__doc__ = """
+Emitted after each call to the API
+:param endpoint: path of the url called (ex: '/campaign')
+:param method: the HTTP method
+:param status: the HTTP status code of the last response (None if no response)
+:param latency: duration of the call in seconds, retries and sleeps included
+:param retries: number of attempts made after the first one
+:param bytes: size of the response body
+:param rate_limit_wait: time spent sleeping because of RATE_EXCEEDED errors (in seconds)
+:param auth_refreshes: number of times the authentication was renewed during the call
+:param error: name of the exception raised, None if the call succeeded
+"""
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_hooks = []
+
+
+def add_hook(hook):
+    """
+    Register a function called with a `RequestEvent` after each call made by any client
+    :param hook: the function
+    """
+    if hook not in _hooks:
+        _hooks.append(hook)
+
+
+def remove_hook(hook):
+    if hook in _hooks:
+        _hooks.remove(hook)
+
+
+def active_hooks(hooks=None):
+    """The global hooks plus `hooks`, None if there is no hook at all"""
+    if not _hooks and not hooks:
+        return None
+    return _hooks + list(hooks or ())
+
+
+def endpoint_of(url):
+    """The path of `url`, used to group the calls per service"""
+    return urlsplit(url).path or '/'
+
+
+def emit(hooks, event):
+    """Send `event` to the `hooks`. A failing hook is logged and never breaks the call"""
+    for hook in hooks:
+        try:
+            hook(event)
+        except Exception as e:
+            logs.logger.warning('Metrics hook %r failed: %r' % (hook, e))
+
+
+class MetricsRegistry(object):
+    """
+    In-process registry of counters, gauges and histograms, exportable in the Prometheus text format
+    or as StatsD lines. Can be registered as a hook to record the `RequestEvent`.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._gauges = {}
+        self._histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        """Increment the counter `name`"""
+        with self._lock:
+            self._counters[self._key(name, labels)] += value
+
+    def set(self, name, value, **labels):
+        """Set the gauge `name`"""
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        """Add `value` to the histogram `name`"""
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # one count per bucket, +Inf, sum
+                histogram = self._histograms[key] = [0] * (len(self.buckets) + 1) + [0.]
+            histogram[bisect.bisect_left(self.buckets, value)] += 1
+            histogram[-1] += value
+
+    def __call__(self, event):
+        labels = {'endpoint': event.endpoint, 'method': event.method, 'status': str(event.status)}
+        self.inc('pynexus_requests_total', **labels)
+        self.observe('pynexus_request_latency_seconds', event.latency, endpoint=event.endpoint,
+                     method=event.method)
+        if event.retries:
+            self.inc('pynexus_request_retries_total', event.retries, endpoint=event.endpoint)
+        if event.bytes:
+            self.inc('pynexus_response_bytes_total', event.bytes, endpoint=event.endpoint)
+        if event.rate_limit_wait:
+            self.inc('pynexus_rate_limit_wait_seconds_total', event.rate_limit_wait, endpoint=event.endpoint)
+        if event.auth_refreshes:
+            self.inc('pynexus_auth_refreshes_total', event.auth_refreshes)
+        if event.error:
+            self.inc('pynexus_request_errors_total', endpoint=event.endpoint, error=event.error)
+
+    def get(self, name, **labels):
+        """Value of a counter or a gauge, or (count, sum) of a histogram"""
+        key = self._key(name, labels)
+        with self._lock:
+            if key in self._histograms:
+                histogram = self._histograms[key]
+                return sum(histogram[:-1]), histogram[-1]
+            if key in self._gauges:
+                return self._gauges[key]
+            return self._counters.get(key, 0)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    @staticmethod
+    def _fmt_labels(labels, **extra):
+        labels = list(labels) + sorted(extra.items())
+        if not labels:
+            return ''
+        return '{%s}' % ','.join('%s="%s"' % (k, str(v).replace('"', '\\"')) for k, v in labels)
+
+    def to_prometheus(self):
+        """Export the metrics in the Prometheus text format"""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            histograms = sorted((k, list(v)) for k, v in self._histograms.items())
+
+        seen = set()
+        for kind, values in (('counter', counters), ('gauge', gauges)):
+            for (name, labels), value in values:
+                if name not in seen:
+                    lines.append('# TYPE %s %s' % (name, kind))
+                    seen.add(name)
+                lines.append('%s%s %s' % (name, self._fmt_labels(labels), value))
+
+        for (name, labels), histogram in histograms:
+            if name not in seen:
+                lines.append('# TYPE %s histogram' % name)
+                seen.add(name)
+            cumulated = 0
+            for bound, count in zip(self.buckets + ('+Inf',), histogram[:-1]):
+                cumulated += count
+                lines.append('%s_bucket%s %d' % (name, self._fmt_labels(labels, le=bound), cumulated))
+            lines.append('%s_sum%s %s' % (name, self._fmt_labels(labels), histogram[-1]))
+            lines.append('%s_count%s %d' % (name, self._fmt_labels(labels), cumulated))
+
+        return '\n'.join(lines) + '\n'
+
+    def to_statsd(self):
+        """Export the metrics as StatsD gauges, labels being sent as DogStatsD tags"""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items()) + sorted(self._gauges.items())
+            histograms = sorted((k, list(v)) for k, v in self._histograms.items())
+
+        def tags(labels):
+            return '|#%s' % ','.join('%s:%s' % x for x in labels) if labels else ''
+
+        for (name, labels), value in counters:
+            lines.append('%s:%s|g%s' % (name, value, tags(labels)))
+        for (name, labels), histogram in histograms:
+            lines.append('%s.count:%d|g%s' % (name, sum(histogram[:-1]), tags(labels)))
+            lines.append('%s.sum:%s|g%s' % (name, histogram[-1], tags(labels)))
+        return lines
+
+
+registry = MetricsRegistry()
+
+
+def enable():
+    """Record the calls of all the clients in the global `registry`"""
+    add_hook(registry)
+
+
+def disable():
+    remove_hook(registry)
@@ -0,0 +1,88 @@
+import os
+
+from . import logs
+from .ve_utils import is_notebook
+
+NONE = 'none'
+TQDM = 'tqdm'
+
+
+def _env_backend():
+    """The backend set by the PYNEXUS_PROGRESS environment variable, 'tqdm' if it is not set or unknown"""
+    backend = os.environ.get('PYNEXUS_PROGRESS', TQDM)
+    if backend not in (NONE, TQDM):
+        logs.logger.warning("PYNEXUS_PROGRESS must be '%s' or '%s', not %r: using '%s'" % (NONE, TQDM, backend, TQDM))
+        return TQDM
+    return backend
+
+
+# default backend, can be set without code change with the PYNEXUS_PROGRESS environment variable
+_backend = _env_backend()
+_tqdm = None
+
+
+def check_backend(backend):
+    """Raise ValueError if `backend` is not 'none', 'tqdm' or a callable"""
+    if backend not in (NONE, TQDM) and not callable(backend):
+        raise ValueError("Progress backend must be '%s', '%s' or a callable, not %r" % (NONE, TQDM, backend))
+
+
+def set_progress_backend(backend):
+    """
+    Set how the progress of the loops is reported, for all the clients that do not set their own
+
+    :param backend: 'none' (no reporting, no overhead), 'tqdm' (progress bars) or a callback
+                    called with (desc, n, total) after each iteration
+    """
+    global _backend
+    check_backend(backend)
+    _backend = backend
+
+
+def get_progress_backend():
+    return _backend
+
+
+def _load_tqdm():
+    """Import the tqdm progress bar matching the environment, on first use"""
+    global _tqdm
+    if _tqdm is None:
+        if is_notebook():
+            from tqdm import tqdm_notebook as _tqdm
+        else:
+            from tqdm import tqdm as _tqdm
+    return _tqdm
+
+
+def _with_callback(iterable, callback, desc, total):
+    n = 0
+    for item in iterable:
+        yield item
+        n += 1
+        callback(desc, n, total)
+
+
+def progress(iterable, total=None, desc=None, leave=True, backend=None):
+    """
+    Wrap `iterable` to report its progress
+
+    :param iterable: the iterable
+    :param total: the number of items (defaults to len(iterable) if available)
+    :param desc: description of the loop
+    :param leave: keep the tqdm bar once the loop is finished
+    :param backend: the backend to use, the global one if None (cf `set_progress_backend`)
+    :return: an iterable over the same items
+    """
+    if backend is None:
+        backend = _backend
+    else:
+        check_backend(backend)
+    if backend == NONE:
+        return iterable
+
+    if total is None and hasattr(iterable, '__len__'):
+        total = len(iterable)
+
+    if backend == TQDM:
+        return _load_tqdm()(iterable, total=total, desc=desc, leave=leave)
+    return _with_callback(iterable, backend, desc, total)
@@ -0,0 +1,49 @@
+import threading
+import time
+
+
+class RateLimiter(object):
+    """
+    Token bucket allowing `rate` requests per `per` seconds, with bursts of up to `burst` requests.
+
+    With `shared=True` the state lives in shared memory: the limiter can be given to worker
+    processes (ex: in the `initargs` of a pool) and limits all of them together.
+    """
+
+    def __init__(self, rate, per=1., burst=None, shared=False):
+        """
+        :param rate: number of requests allowed per `per` seconds
+        :param per: the period in seconds
+        :param burst: the maximum number of requests made at once (default: `rate`)
+        :param shared: share the limiter between processes
+        """
+        self.rate = float(rate) / per
+        self.burst = float(burst or rate)
+
+        if shared:
+            import multiprocessing
+            self._state = multiprocessing.Array('d', [self.burst, time.monotonic()])
+            self._lock = self._state.get_lock()
+        else:
+            self._state = [self.burst, time.monotonic()]
+            self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """
+        Wait until `tokens` requests can be made
+        :return: the time waited (in seconds)
+        """
+        waited = 0.
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                available = min(self.burst, self._state[0] + (now - self._state[1]) * self.rate)
+                self._state[1] = now
+                if available >= tokens:
+                    self._state[0] = available - tokens
+                    return waited
+                self._state[0] = available
+                wait = (tokens - available) / self.rate
+
+            time.sleep(wait)
+            waited += wait
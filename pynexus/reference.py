@@ -0,0 +1,185 @@
+"""
+Reference data (countries, cities, devices, browsers, operating systems) downloaded once,
+kept on disk and indexed in memory to decode the ids of the reports.
+
+    reference = ReferenceData(AppNexusAPI(**APPNEXUS_ACCOUNT), path='reference')
+    reference['country'].name(12)
+    reference['city'].decode(report['city_id'])
+"""
+import gzip
+import json
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import logs, scheduling
+
+# table -> AppNexusAPI getter
+TABLES = {
+    'country': 'get_country',
+    'city': 'get_city',
+    'device': 'get_device',
+    'browser': 'get_browser',
+    'operating_system': 'get_operating_system',
+    'operating_system_extended': 'get_operating_system_extended',
+}
+
+
+class ReferenceTable(object):
+    """
+    id <-> name mapping of a reference table, with O(1) lookups in both directions
+    """
+
+    def __init__(self, table, ids, names, loaded_on=None):
+        self.table = table
+        self.ids = list(ids)
+        self.names = list(names)
+        self.loaded_on = loaded_on or time.time()
+        self.id_to_name = dict(zip(self.ids, self.names))
+        self.name_to_id = {}
+        for id_, name_ in zip(self.ids, self.names):
+            # for duplicated names (ex: cities), the smallest id is kept
+            self.name_to_id.setdefault(name_, id_)
+        self._sorted = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, id_):
+        return id_ in self.id_to_name
+
+    def __getitem__(self, id_):
+        return self.id_to_name[id_]
+
+    def name(self, id_, default=None):
+        return self.id_to_name.get(id_, default)
+
+    def id(self, name, default=None):
+        return self.name_to_id.get(name, default)
+
+    def decode(self, ids, default=None):
+        """
+        Names of a whole column of ids
+
+        :param ids: list, NumPy array or pandas Series of ids
+        :param default: the name of the unknown ids
+        :return: same type as `ids` for a Series, NumPy object array if NumPy is installed, list otherwise
+        """
+        if hasattr(ids, 'map') and hasattr(ids, 'index'):
+            # pandas Series
+            return ids.map(self.id_to_name).where(lambda x: x.notnull(), default)
+
+        try:
+            import numpy as np
+        except ImportError:
+            return [self.id_to_name.get(x, default) for x in ids]
+
+        values = np.asarray(ids)
+        if values.dtype.kind not in 'iu' or not self.ids:
+            return np.array([self.id_to_name.get(x, default) for x in ids], dtype=object)
+
+        if self._sorted is None:
+            sorted_ids = np.asarray(self.ids, dtype=np.int64)
+            order = np.argsort(sorted_ids)
+            self._sorted = sorted_ids[order], np.asarray(self.names, dtype=object)[order]
+        sorted_ids, sorted_names = self._sorted
+
+        positions = np.clip(np.searchsorted(sorted_ids, values), 0, len(sorted_ids) - 1)
+        found = sorted_ids[positions] == values
+        result = np.full(values.shape, default, dtype=object)
+        result[found] = sorted_names[positions[found]]
+        return result
+
+    def encode(self, names, default=None):
+        """Ids of a whole column of names"""
+        if hasattr(names, 'map') and hasattr(names, 'index'):
+            return names.map(self.name_to_id)
+        return [self.name_to_id.get(x, default) for x in names]
+
+    def save(self, path):
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            json.dump({'table': self.table, 'loaded_on': self.loaded_on, 'ids': self.ids, 'names': self.names}, f,
+                      separators=(',', ':'))
+
+    @classmethod
+    def load(cls, path):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data['table'], data['ids'], data['names'], data['loaded_on'])
+
+
+class ReferenceData(object):
+    """
+    The reference tables, downloaded once (concurrently, page by page) and stored in `path`
+    """
+
+    def __init__(self, api, path=None, max_workers=8, max_age=7 * 24 * 3600):
+        """
+        :param api: the AppNexusAPI to use
+        :param path: folder where to store the tables (in memory only if None)
+        :param max_workers: number of pages downloaded at the same time
+        :param max_age: age (in seconds) after which a stored table is downloaded again
+        """
+        self.api = api
+        self.path = path
+        self.max_workers = max_workers
+        self.max_age = max_age
+        self._tables = {}
+
+    def _file(self, table):
+        return os.path.join(self.path, '%s.json.gz' % table)
+
+    def __getitem__(self, table):
+        return self.table(table)
+
+    def table(self, table, refresh=False):
+        """
+        The reference table `table`, from memory, from disk or downloaded
+        :param table: one of `TABLES`
+        :param refresh: download the table even if it is stored
+        :return: ReferenceTable
+        """
+        if table not in TABLES:
+            raise ValueError("Unknown reference table '%s', expected one of %s" % (table, ', '.join(TABLES)))
+
+        if not refresh and table in self._tables:
+            return self._tables[table]
+
+        if not refresh and self.path and os.path.exists(self._file(table)):
+            stored = ReferenceTable.load(self._file(table))
+            if time.time() - stored.loaded_on < self.max_age:
+                self._tables[table] = stored
+                return stored
+
+        self._tables[table] = self.download(table)
+        return self._tables[table]
+
+    def load(self, tables=None, refresh=False):
+        """Load many tables, concurrently"""
+        tables = tables or list(TABLES)
+        with ThreadPoolExecutor(max_workers=len(tables)) as executor:
+            return dict(zip(tables, executor.map(lambda x: self.table(x, refresh=refresh), tables)))
+
+    def download(self, table):
+        """Download all the pages of `table` and store it"""
+        getter = getattr(self.api, TABLES[table])
+        count = getter(start_element=0, num_elements=1, only_names=False).get('count', 0)
+        page_size = self.api.max_elems
+        logs.logger.info('%s: downloading %d elements' % (table, count))
+
+        def get_page(i):
+            return getter(start_element=i * page_size, num_elements=page_size, only_names=True)
+
+        get_page = scheduling.bind(get_page, scheduling.BULK)
+        names = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for page in executor.map(get_page, range(math.ceil(count / page_size))):
+                names.update(page)
+
+        ids = sorted(names)
+        reference = ReferenceTable(table, ids, [names[x] for x in ids])
+        if self.path:
+            os.makedirs(self.path, exist_ok=True)
+            reference.save(self._file(table))
+        return reference
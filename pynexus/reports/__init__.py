@@ -1 +1,2 @@
 from .api import ReportsAPI, ReportNotDownloadedError
+from .enrich import ReportEnricher
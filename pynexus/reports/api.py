@@ -4,7 +4,9 @@ import datetime as dt
 from collections import namedtuple
 
 from ..ve_utils import clock, zip_files
-from ..base_api import BaseAPI, InvalidParamsError, tqdm_list, trange
+from .. import logs, scheduling
+from ..base_api import BaseAPI, InvalidParamsError
+from .registry import canonical, report_age, REUSE_MAX_AGE
 
 
 class ReportNotDownloadedError(Exception):
@@ -21,91 +23,158 @@ Report = namedtuple('Report', ['type', 'path', 'file'])
 class ReportsAPI(BaseAPI):
     report_url = "{}/report".format(BaseAPI.base_url)
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, report_registry=None, **kwargs):
+        """
+        :param report_registry: ReportRegistry of the reports to reuse (ex: `registry.registry`, the one of the
+                                process), None (default) to submit every report
+        """
         super().__init__(*args, **kwargs)
+        self.report_registry = report_registry
 
-    def _write_report(self, report, path, report_type):
+    def _submit_report(self, report, report_type):
+        response = self._make_request(method='POST', url=self.report_url, json=report)
+        if "error" in response:
+            raise InvalidParamsError("[%s]: %s" % (report_type, response['error']))
+        return response['report_id']
+
+    def find_report(self, report, max_age=None):
+        """
+        Search the history of the reports for a report with the definition `report`
+        :param report: a dict containing the parameters of the report
+        :param max_age: the maximum age (in seconds) of the report, default: the one of the registry
+        :return: (report_id, age in seconds) of the most recent one, None if there is none
+                 (the reports neither pending nor ready, ex: failed, are left out)
+        """
+        max_age = max_age or (self.report_registry.max_age if self.report_registry else REUSE_MAX_AGE)
+        key = canonical(report)
+        found = None
+        for previous in self.get_reports_hist().get('reports') or []:
+            age = report_age(previous)
+            if age is None or age >= max_age or not previous.get('json_request'):
+                continue
+            if previous.get('execution_status') not in ('pending', 'ready'):
+                continue
+            try:
+                same = canonical(previous['json_request']) == key
+            except ValueError:
+                continue
+            if same and (found is None or age < found[1]):
+                found = previous['id'], age
+        return found
+
+    def _report_id(self, report, report_type, key):
+        """The report_id of a report already submitted with the same definition, or of a new one"""
+        if key is None:
+            return self._submit_report(report, report_type)
+
+        def submit():
+            found = self.find_report(report)
+            if found:
+                logs.logger.info('[%s] reusing the report %s requested %ds ago' % (report_type, found[0], found[1]))
+                return found
+            return self._submit_report(report, report_type), 0.
+
+        return self.report_registry.report_id(key, submit)
+
+    def _write_report(self, report, path, report_type, enricher=None, reuse=True):
         """
         Makes calls to get the report `report_type` with params `report` and write it to `path`
         :param report: a dict containing the parameters of the report
         :param path: where to write the report
         :param report_type: the type of the report
+        :param enricher: ReportEnricher joining the names onto the id columns while the report is downloaded
+        :param reuse: reuse an identical report recently requested (cf `report_registry`)
         :return: the file
         """
-        file, resp = None, None
+        file, resp, report_id = None, None, None
+        key = None
+        if reuse and self.report_registry is not None:
+            key = (self.base_url, self.user['username'], canonical(report))
 
         def part_1():
-            nonlocal resp
-            response = self._make_request(method='POST', url=self.report_url,
-                                          json=report)
-            if "error" in response:
-                raise InvalidParamsError("[%s]: %s" % (report_type, response['error']))
-
-            resp = response
+            nonlocal resp, report_id
+            report_id = self._report_id(report, report_type, key)
+            resp = {'report_id': report_id}
 
+        @scheduling.priority(scheduling.POLL)
         def part_2():
             nonlocal resp
             max_retry_wait = 500  # 15min
             success = False
-            for _ in trange(max_retry_wait, desc="pending state", leave=False):
-                # Workaround for the bar to leave
-                if success:
-                    continue
-
+            for _ in self._progress(range(max_retry_wait), desc="pending state", leave=False):
                 response = self._make_request(url=self.report_url, method='GET',
                                               params={'id': resp['report_id']})
                 if response['execution_status'] != "pending":
                     success = True
-                time.sleep(2)
+                    break
+                time.sleep(self.poll_interval)
 
             if not success:
                 raise ReportNotDownloadedError('Report could not be downloaded')
+            if response['execution_status'] != 'ready':
+                raise ReportNotDownloadedError('[%s] report %s: %s' % (report_type, resp['report_id'],
+                                                                       response['execution_status']))
             resp = response
 
         def part_3():
             nonlocal file
 
-            download_url = "{base_url}/{url}".format(base_url=BaseAPI.base_url,
+            download_url = "{base_url}/{url}".format(base_url=self.base_url,
                                                      url=resp['report']['url'])
-            file = self._download_file(url=download_url, path=path,
-                                       file_size=resp['report']['report_size'])
+            if enricher is None:
+                file = self._download_file(url=download_url, path=path,
+                                           file_size=resp['report']['report_size'])
+            else:
+                sink = self._download_file(url=download_url, file_size=resp['report']['report_size'],
+                                           sink=enricher.sink(path))
+                file = sink.close()
 
         processes = [part_1, part_2, part_3]
-        for f in tqdm_list(processes, desc="Progress", leave=False):
-            f()
+        try:
+            for f in self._progress(processes, desc="Progress", leave=False):
+                f()
+        except Exception:
+            # the next submissions do not wait for a report that failed
+            if key is not None and report_id is not None:
+                self.report_registry.discard(key, report_id)
+            raise
 
         return file
 
     @clock()
-    def get_report(self, report_fields):
+    def get_report(self, report_fields, enricher=None, reuse=True):
         """
         Get a report and returns it
         :param report_fields:
+        :param enricher: ReportEnricher adding the names of the ids to the report
+        :param reuse: reuse an identical report recently requested (cf `report_registry`)
         :return: Report namedtuple
         """
         report_type = report_fields['report']['report_type']
-        file = self._write_report(report_fields, None, report_type)
+        file = self._write_report(report_fields, None, report_type, enricher, reuse)
         return Report(report_type, None, file)
 
     @clock()
-    def get_reports(self, reports_fields):
+    def get_reports(self, reports_fields, enricher=None):
         """
         Get the reports an return them
         :param reports_fields: a dict containing the name of the reports and the parameters of the reports
+        :param enricher: ReportEnricher adding the names of the ids to the reports
         :return: dict of the reports
         """
         reports = {}
-        for report_name, report_field in tqdm_list(reports_fields.items(), desc="Reports", leave=False):
-            reports[report_name] = self.get_report(report_field)
+        for report_name, report_field in self._progress(reports_fields.items(), desc="Reports", leave=False):
+            reports[report_name] = self.get_report(report_field, enricher)
 
         return reports
 
     @clock()
-    def save_report(self, report_name, report_fields, reports_folder):
+    def save_report(self, report_name, report_fields, reports_folder, enricher=None):
         """Refer to Refer to https://wiki.appnexus.com/display/api/Report+Service
         :param report_name: name of the report
         :param reports_folder: folder to write the results to
         :param report_fields: the report parameters
+        :param enricher: ReportEnricher adding the names of the ids to the report
         :return: the type of the report and the path of the file
         """
         report_type = report_fields['report']['report_type']
@@ -115,12 +184,12 @@ class ReportsAPI(BaseAPI):
             folder=reports_folder,
             report_name=report_name)
 
-        self._write_report(report_fields, path, report_type)
+        self._write_report(report_fields, path, report_type, enricher)
 
         return Report(report_type, path, None)
 
     @clock()
-    def save_reports(self, reports_fields, reports_folder, zip_reports=True, zip_name=None):
+    def save_reports(self, reports_fields, reports_folder, zip_reports=True, zip_name=None, enricher=None):
         """
         Refer to Refer to https://wiki.appnexus.com/display/api/Report+Service
         :param reports_folder: folder to write the reports to
@@ -128,21 +197,42 @@ class ReportsAPI(BaseAPI):
         :param zip_reports: zip the reports to or not
         :param zip_name: the name of the zip file. If not specified, the name is set to
                         `"reports_{}".format(dt.datetime.now().date())`
+        :param enricher: ReportEnricher adding the names of the ids to the reports
         :return:
         """
         if zip_reports:
-            reports = self.get_reports(reports_fields)
+            reports = self.get_reports(reports_fields, enricher)
             result = self.zip_reports(reports, reports_folder, zip_name)
         else:
             reports = {}
-            for report_name, report_field in tqdm_list(reports_fields.items(), desc="Reports", leave=False):
+            for report_name, report_field in self._progress(reports_fields.items(), desc="Reports", leave=False):
                 report_result = self.save_report(report_name, report_field,
-                                                 reports_folder)
+                                                 reports_folder, enricher)
                 reports[report_result.path] = report_result
             result = reports
 
         return result
 
+    @clock()
+    def ingest_report(self, report_name, report_fields, store_folder, time_column='hour', lookback_hours=6,
+                      initial_days=30):
+        """
+        Ingest the rows of a report received since the last ingestion in a store partitioned by day
+        (cf `incremental.IncrementalReport`)
+        :param report_name: name of the report, the folder of its partitions in `store_folder`
+        :param report_fields: the report parameters, its interval is replaced by the window to ingest
+        :param store_folder: folder of the store
+        :param time_column: the column of the report giving the time of the rows ('hour' or 'day')
+        :param lookback_hours: how many hours before the last one received are requested again, for the late data
+        :param initial_days: the number of days requested by the first ingestion
+        :return: the number of rows received
+        """
+        from .incremental import IncrementalReport
+
+        report = IncrementalReport(report_name, report_fields, store_folder, time_column=time_column,
+                                   lookback_hours=lookback_hours, initial_days=initial_days)
+        return report.ingest(self)
+
     def get_reports_meta(self):
         response = self._make_request(method='GET', url="%s?meta" % self.report_url)
         return response
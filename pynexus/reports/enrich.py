@@ -0,0 +1,212 @@
+"""
+Enrichment of the reports: the names of the objects are joined onto their id columns.
+
+    enricher = ReportEnricher(AppNexusAPI(**APPNEXUS_ACCOUNT))
+    report = ReportsAPI(**APPNEXUS_ACCOUNT).get_report(network_analytics_fields, enricher=enricher)
+
+The distinct ids of each column are collected while the report is downloaded and their names
+are looked up by batches, concurrently, as soon as enough new ids are seen. The names are kept
+in the cache of the enricher, so the next reports only look up the ids they are the first to see.
+A column `<object>_name` is added after each enriched column `<object>_id`.
+"""
+import csv
+import io
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from io import BytesIO
+
+from .. import logs, scheduling
+
+# report column -> AppNexusAPI getter
+COLUMNS = {
+    'advertiser_id': 'get_advertiser',
+    'insertion_order_id': 'get_insertion_order',
+    'line_item_id': 'get_line_item',
+    'campaign_id': 'get_campaign',
+    'pixel_id': 'get_pixel',
+}
+
+
+def name_column(column):
+    """The column of the names of `column` (ex: advertiser_id -> advertiser_name)"""
+    return (column[:-3] if column.endswith('_id') else column) + '_name'
+
+
+class ReportEnricher(object):
+    """
+    Joins the names of the objects onto the id columns of the reports, with a cache shared by all the reports
+    """
+
+    def __init__(self, api, columns=None, max_workers=4, batch_size=None, spool_size=32 * 1024 * 1024):
+        """
+        :param api: the AppNexusAPI to use for the lookups
+        :param columns: dict column -> getter of the AppNexusAPI (or list of columns of `COLUMNS`), default `COLUMNS`
+        :param max_workers: number of lookups made at the same time
+        :param batch_size: number of ids per lookup (default: `api.max_elems`)
+        :param spool_size: size (in bytes) above which a downloaded report is kept on disk until it is enriched
+        """
+        if columns is None:
+            columns = COLUMNS
+        elif not isinstance(columns, dict):
+            columns = {x: COLUMNS[x] for x in columns}
+
+        self.api = api
+        self.columns = columns
+        self.max_workers = max_workers
+        self.batch_size = batch_size or api.max_elems
+        self.spool_size = spool_size
+        self.cache = {x: {} for x in columns}
+        self._lock = threading.Lock()
+
+    def lookup(self, column, ids):
+        """
+        Get the names of `ids` and add them to the cache, the unknown ids are cached as without name
+        :param column: the column of the ids
+        :param ids: list of ids (as str)
+        """
+        getter = getattr(self.api, self.columns[column])
+        try:
+            names = getter(ids=ids, only_names=True)
+        except Exception as e:
+            # the report is still written, the names of these ids stay empty
+            logs.logger.warning('%s: lookup of %d ids failed (%s: %s)' % (column, len(ids), type(e).__name__, e))
+            return
+
+        with self._lock:
+            cache = self.cache[column]
+            for id_ in ids:
+                cache[id_] = None
+            for id_, name in names.items():
+                cache[str(id_)] = name
+
+    def sink(self, path=None):
+        """
+        A file-like object to download a report to, see `EnrichmentSink`
+        :param path: where to write the enriched report, to BytesIO if None
+        """
+        return EnrichmentSink(self, path)
+
+    def enrich(self, file, path=None, chunk_size=64 * 1024):
+        """
+        Enrich a report already downloaded
+        :param file: the report, file-like object or path
+        :param path: where to write the enriched report, to BytesIO if None
+        :return: BytesIO if no path is specified otherwise nothing
+        """
+        sink = self.sink(path)
+        f = open(file, 'rb') if isinstance(file, str) else file
+        try:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                sink.write(chunk)
+        finally:
+            if f is not file:
+                f.close()
+        return sink.close()
+
+
+class EnrichmentSink(object):
+    """
+    File-like object the report is written to as it is downloaded.
+
+    Each chunk is parsed to collect the distinct ids of the enriched columns; a lookup is submitted
+    every `batch_size` new ids, while the download goes on. `close` waits for the last lookups and
+    writes the report with the names.
+    """
+
+    def __init__(self, enricher, path=None):
+        self.enricher = enricher
+        self.path = path
+        self._rows = tempfile.SpooledTemporaryFile(max_size=enricher.spool_size)
+        self._rest = b''
+        self._positions = None
+        self._seen = {x: set() for x in enricher.columns}
+        self._pending = {x: [] for x in enricher.columns}
+        self._futures = []
+        self._executor = ThreadPoolExecutor(max_workers=enricher.max_workers)
+        self._lookup = scheduling.bind(enricher.lookup, scheduling.BULK)
+
+    def write(self, chunk):
+        self._rows.write(chunk)
+        lines = (self._rest + chunk).split(b'\n')
+        self._rest = lines.pop()
+        if lines:
+            self._collect(lines)
+        return len(chunk)
+
+    def _collect(self, lines):
+        rows = csv.reader(x.decode('utf-8') for x in lines)
+        if self._positions is None:
+            header = next(rows, None)
+            if header is None:
+                return
+            self._positions = [(x, header.index(x)) for x in self.enricher.columns if x in header]
+
+        cache = self.enricher.cache
+        for row in rows:
+            for column, i in self._positions:
+                id_ = row[i] if i < len(row) else ''
+                seen = self._seen[column]
+                if id_ in seen:
+                    continue
+                seen.add(id_)
+                if id_.isdigit() and id_ != '0' and id_ not in cache[column]:
+                    self._add(column, id_)
+
+    def _add(self, column, id_):
+        pending = self._pending[column]
+        pending.append(id_)
+        if len(pending) >= self.enricher.batch_size:
+            self._futures.append(self._executor.submit(self._lookup, column, pending))
+            self._pending[column] = []
+
+    def close(self):
+        """
+        Wait for the lookups and write the enriched report
+        :return: BytesIO if no path is specified otherwise nothing
+        """
+        try:
+            if self._rest:
+                self._collect([self._rest])
+            for column, ids in self._pending.items():
+                if ids:
+                    self._futures.append(self._executor.submit(self._lookup, column, ids))
+            wait(self._futures)
+        finally:
+            self._executor.shutdown()
+
+        try:
+            return self._write()
+        finally:
+            self._rows.close()
+
+    def _write(self):
+        self._rows.seek(0)
+        # SpooledTemporaryFile is only readable by TextIOWrapper from Python 3.11: its BytesIO or file is wrapped
+        rows = csv.reader(io.TextIOWrapper(self._rows._file, encoding='utf-8', newline=''))
+        f = open(self.path, 'wb') if self.path else BytesIO()
+        out = io.TextIOWrapper(f, encoding='utf-8', newline='')
+        writer = csv.writer(out, lineterminator='\n')
+
+        header = next(rows, None)
+        if header is not None:
+            # the name columns are inserted after their id column, from the last one to keep the positions
+            positions = sorted(self._positions or [], key=lambda x: -x[1])
+            names = [(i + 1, self.enricher.cache[column]) for column, i in positions]
+            for column, i in positions:
+                header.insert(i + 1, name_column(column))
+            writer.writerow(header)
+
+            for row in rows:
+                for i, cache in names:
+                    id_ = row[i - 1] if i - 1 < len(row) else ''
+                    row.insert(i, cache.get(id_) or '')
+                writer.writerow(row)
+
+        out.flush()
+        out.detach()
+        if self.path:
+            f.close()
+            return None
+        f.seek(0)
+        return f
@@ -0,0 +1,213 @@
+"""
+Incremental ingestion of a report into a local store partitioned by day.
+
+    store = IncrementalReport('network_analytics', network_analytics_fields, 'reports_store', lookback_hours=6)
+    store.ingest(ReportsAPI(**APPNEXUS_ACCOUNT))     # every hour
+
+The first ingestion requests the last `initial_days` days. Each next one only requests the window
+from the watermark (the last hour received) minus `lookback_hours`, to get the late data, until now.
+The rows of the window replace the stored ones: the partitions `<store>/<name>/<YYYY-MM-DD>.csv`
+keep their rows before the window and get the rows of the report for the rest.
+"""
+import csv
+import datetime as dt
+import io
+import json
+import os
+
+from .. import logs
+from .registry import canonical
+
+TIME_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d')
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def parse_time(value):
+    """datetime of a value of the time column of a report ('2017-01-01 13:00:00' or '2017-01-01')"""
+    for time_format in TIME_FORMATS:
+        try:
+            return dt.datetime.strptime(value, time_format)
+        except ValueError:
+            pass
+    raise ValueError("Unknown time format: '%s'" % value)
+
+
+def _write_atomic(path, write):
+    tmp_path = '%s.tmp' % path
+    with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+class IncrementalReport(object):
+    """
+    A report definition ingested window by window, with its watermark, in a local partitioned store
+    """
+
+    def __init__(self, name, report_fields, store_folder, time_column='hour', lookback_hours=6, initial_days=30):
+        """
+        :param name: name of the report, the folder of its partitions in `store_folder`
+        :param report_fields: the report parameters, its interval is replaced by the window to ingest
+        :param store_folder: folder of the store
+        :param time_column: the column of the report giving the time of the rows ('hour' or 'day'),
+                            it must be one of its columns
+        :param lookback_hours: how many hours before the watermark are requested again, for the late data
+        :param initial_days: the number of days requested by the first ingestion
+        """
+        columns = report_fields['report'].get('columns') or []
+        if time_column not in columns:
+            raise ValueError("Report '%s': the time column '%s' is not one of the columns" % (name, time_column))
+
+        self.name = name
+        self.report_fields = report_fields
+        self.folder = os.path.join(store_folder, name)
+        self.time_column = time_column
+        self.lookback = dt.timedelta(hours=lookback_hours)
+        self.initial_days = initial_days
+        self.definition = canonical(self._definition(report_fields))
+
+    @staticmethod
+    def _definition(report_fields):
+        """The report parameters without their interval"""
+        report = {k: v for k, v in report_fields['report'].items()
+                  if k not in ('report_interval', 'start_date', 'end_date')}
+        return dict(report_fields, report=report)
+
+    @property
+    def _state_path(self):
+        return os.path.join(self.folder, '_state.json')
+
+    def _partition_path(self, day):
+        return os.path.join(self.folder, '%s.csv' % day)
+
+    @property
+    def watermark(self):
+        """The time of the last row ingested, None if nothing was ingested"""
+        if not os.path.exists(self._state_path):
+            return None
+        with open(self._state_path) as f:
+            state = json.load(f)
+        if state['definition'] != self.definition:
+            raise ValueError("Report '%s': the store %s holds another report definition, use another name "
+                             "or remove it" % (self.name, self.folder))
+        return parse_time(state['watermark']) if state.get('watermark') else None
+
+    def _set_watermark(self, watermark):
+        state = {'definition': self.definition, 'watermark': watermark.strftime(DATE_FORMAT)}
+        _write_atomic(self._state_path, lambda f: json.dump(state, f))
+
+    def _round(self, time):
+        """`time` rounded down to the granularity of the time column (the hour, or the day for 'day')"""
+        if self.time_column == 'day':
+            return dt.datetime.combine(time.date(), dt.time())
+        return time.replace(minute=0, second=0, microsecond=0)
+
+    def window(self, now=None):
+        """
+        The interval to request: from the watermark minus the lookback (or `initial_days` ago) until tomorrow,
+        the end covering the hours of the day whatever the timezone of the report
+        :return: (start, end) datetimes, the start being an hour (a day if the time column is 'day')
+        """
+        now = now or dt.datetime.utcnow()
+        watermark = self.watermark
+        if watermark is None:
+            start = dt.datetime.combine(now.date() - dt.timedelta(days=self.initial_days), dt.time())
+        else:
+            start = self._round(watermark - self.lookback)
+        end = dt.datetime.combine(now.date() + dt.timedelta(days=1), dt.time())
+        return start, end
+
+    def report_window(self, start, end):
+        """The report parameters requesting the rows from `start` (included) to `end` (excluded)"""
+        report = {k: v for k, v in self.report_fields['report'].items() if k != 'report_interval'}
+        report.update(start_date=start.strftime(DATE_FORMAT), end_date=end.strftime(DATE_FORMAT))
+        return dict(self.report_fields, report=report)
+
+    def ingest(self, api, now=None):
+        """
+        Request the rows since the watermark and upsert them in the store
+        :param api: the ReportsAPI to use
+        :param now: the current time (UTC)
+        :return: the number of rows received
+        """
+        start, end = self.window(now)
+        logs.logger.info('[%s] ingesting from %s to %s' % (self.name, start, end))
+        # a report reused from an earlier run would miss the late data of the lookback
+        report = api.get_report(self.report_window(start, end), reuse=False)
+        return self.upsert(report.file, start)
+
+    def upsert(self, file, start):
+        """
+        Replace the rows of the store from `start` with the rows of the report `file`, then move the watermark
+        :param file: the report (csv), file-like object
+        :param start: the beginning of the window of the report
+        :return: the number of rows of the report
+        """
+        # a stored row is either before the window or replaced, never a part of a day or an hour
+        start = self._round(start)
+        file.seek(0)
+        rows = csv.reader(io.TextIOWrapper(file, encoding='utf-8', newline=''))
+        header = next(rows, None)
+        if header is None:
+            return 0
+        position = header.index(self.time_column)
+
+        days, watermark, count = {}, None, 0
+        for row in rows:
+            if not row:
+                continue
+            time = parse_time(row[position])
+            days.setdefault(time.strftime('%Y-%m-%d'), []).append(row)
+            watermark = time if watermark is None or time > watermark else watermark
+            count += 1
+
+        os.makedirs(self.folder, exist_ok=True)
+        # the stored days of the window get the rows of the report, even when it has none for them
+        stored = [x[:-len('.csv')] for x in os.listdir(self.folder) if x.endswith('.csv')]
+        first_day = start.strftime('%Y-%m-%d')
+        for day in sorted(set(days) | {x for x in stored if x >= first_day}):
+            self._upsert_partition(day, header, position, start, days.get(day, []))
+
+        previous = self.watermark
+        if watermark is not None and (previous is None or watermark > previous):
+            self._set_watermark(watermark)
+
+        logs.logger.info('[%s] %d rows ingested in %d partitions' % (self.name, count, len(days)))
+        return count
+
+    def _upsert_partition(self, day, header, position, start, new_rows):
+        path = self._partition_path(day)
+        kept = []
+        if os.path.exists(path):
+            with open(path, newline='', encoding='utf-8') as f:
+                stored = csv.reader(f)
+                stored_header = next(stored, None)
+                if stored_header is not None and stored_header != header:
+                    raise ValueError("Report '%s': the columns of %s differ from the ones of the report"
+                                     % (self.name, path))
+                kept = [x for x in stored if x and parse_time(x[position]) < start]
+
+        def write(f):
+            writer = csv.writer(f, lineterminator='\n')
+            writer.writerow(header)
+            writer.writerows(kept)
+            writer.writerows(new_rows)
+
+        _write_atomic(path, write)
+
+    def partitions(self, start=None, end=None):
+        """The paths of the partitions of the days from `start` to `end` (dates or 'YYYY-MM-DD'), included"""
+        start, end = (str(x)[:10] if x is not None else None for x in (start, end))
+        if not os.path.isdir(self.folder):
+            return []
+        days = sorted(x[:-len('.csv')] for x in os.listdir(self.folder) if x.endswith('.csv'))
+        return [self._partition_path(x) for x in days
+                if (start is None or x >= start) and (end is None or x <= end)]
+
+    def read(self, start=None, end=None):
+        """pandas DataFrame of the rows of the days from `start` to `end`"""
+        import pandas as pd
+        paths = self.partitions(start, end)
+        if not paths:
+            return pd.DataFrame()
+        return pd.concat([pd.read_csv(x) for x in paths], ignore_index=True)
@@ -0,0 +1,114 @@
+"""
+Deduplication of the report submissions.
+
+A report definition submitted again while it is computed, or shortly after, reuses the report
+already requested instead of computing a new one (opt-in: `ReportsAPI(report_registry=registry)`):
+
+- in the process, the identical submissions made at the same time share one report_id
+  (the registry keeps the report_ids of the definitions submitted in the last `max_age` seconds)
+- otherwise, the history of the reports of the user (`ReportsAPI.get_reports_hist`) is searched
+  for a report of the same definition, pending or ready, requested in the last `max_age` seconds
+"""
+import datetime as dt
+import json
+import threading
+import time
+from concurrent.futures import Future
+
+# the reports can be downloaded during one hour after their creation
+REPORT_MAX_AGE = 3600
+# a report is reused during a few minutes only: the relative intervals (ex: last_hour) move on
+REUSE_MAX_AGE = 300
+
+
+def canonical(report):
+    """The json of a report definition, identical for the equal definitions"""
+    if isinstance(report, str):
+        report = json.loads(report)
+    return json.dumps(report, sort_keys=True, separators=(',', ':'))
+
+
+def report_age(report, now=None):
+    """Age (in seconds) of a report of the history, None if its creation date is unknown"""
+    try:
+        created_on = dt.datetime.strptime(report['created_on'], '%Y-%m-%d %H:%M:%S')
+    except (KeyError, TypeError, ValueError):
+        return None
+    # AppNexus dates are UTC
+    return ((now or dt.datetime.utcnow()) - created_on).total_seconds()
+
+
+class ReportRegistry(object):
+    """
+    The report_ids of the report definitions submitted in this process, shared by the clients
+    """
+
+    def __init__(self, max_age=REUSE_MAX_AGE):
+        """
+        :param max_age: time (in seconds) during which a report is reused, at most `REPORT_MAX_AGE`
+        """
+        if not 0 < max_age <= REPORT_MAX_AGE:
+            raise ValueError('max_age must be between 0 and %d seconds, got %s' % (REPORT_MAX_AGE, max_age))
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._recent = {}
+
+    def report_id(self, key, submit):
+        """
+        The report_id of the definition `key`: the one of an identical submission in progress or recent,
+        otherwise the one returned by `submit`
+
+        :param key: the key of the definition (cf `canonical`)
+        :param submit: function without argument submitting the report (or finding one already submitted)
+                       and returning its report_id and its age (in seconds)
+        :return: the report_id
+        """
+        with self._lock:
+            self._evict()
+            recent = self._recent.get(key)
+            if recent:
+                return recent[0]
+
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self._in_flight[key] = Future()
+
+        if not owner:
+            return future.result()
+
+        try:
+            report_id, age = submit()
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._in_flight[key]
+            self._recent[key] = report_id, time.monotonic() - age
+        future.set_result(report_id)
+        return report_id
+
+    def _evict(self):
+        """Remove the reports older than `max_age`, called with the lock held"""
+        now = time.monotonic()
+        for key in [k for k, (_, created) in self._recent.items() if now - created >= self.max_age]:
+            del self._recent[key]
+
+    def discard(self, key, report_id=None):
+        """Stop reusing the report of `key` (ex: it failed), only if it is `report_id` when given"""
+        with self._lock:
+            recent = self._recent.get(key)
+            if recent and (report_id is None or recent[0] == report_id):
+                del self._recent[key]
+
+    def clear(self):
+        with self._lock:
+            self._recent.clear()
+
+
+# a registry shared by the clients of the process which opt in
+registry = ReportRegistry()
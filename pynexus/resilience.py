@@ -0,0 +1,191 @@
+"""
+Tail-latency and failure control of the requests.
+
+    api = AppNexusAPI(**APPNEXUS_ACCOUNT, hedger=Hedger(), circuit_breaker=CircuitBreaker())
+
+- `Hedger`: a GET still running after the p95 of the latencies of its endpoint is sent a second
+  time, the first response received is used. The hedges are limited to `max_ratio` of the requests.
+- `CircuitBreaker`: after `failure_threshold` consecutive failures (timeouts, connection errors,
+  5xx) of an endpoint, its requests fail at once with `CircuitOpenError` during `recovery_time`
+  seconds, then one probe request is let through (half-open): its success closes the circuit,
+  its failure opens it again.
+
+Both record their activity in `metrics.registry` (pynexus_hedged_requests_total, pynexus_hedge_wins_total,
+pynexus_circuit_state, pynexus_circuit_opened_total, pynexus_circuit_rejected_total).
+"""
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from . import metrics
+
+CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+
+class CircuitOpenError(Exception):
+    """
+    raised when a request is not sent because the circuit of its endpoint is open
+    """
+    pass
+
+
+class Hedger(object):
+    """
+    Sends again the GET requests slower than the p95 of their endpoint and keeps the first response
+    """
+
+    def __init__(self, percentile=95, min_samples=20, window=200, min_delay=0.01, max_delay=None,
+                 max_ratio=0.1, max_workers=32, registry=metrics.registry):
+        """
+        :param percentile: the percentile of the latencies after which a request is hedged
+        :param min_samples: the number of latencies of an endpoint needed before hedging its requests
+        :param window: the number of recent latencies kept per endpoint
+        :param min_delay: the minimum delay (in seconds) before hedging
+        :param max_delay: the maximum delay (in seconds) before hedging (ex: a fraction of the timeout)
+        :param max_ratio: the maximum ratio of the requests hedged
+        :param max_workers: the number of requests in flight at the same time
+        :param registry: the MetricsRegistry where to record the hedges
+        """
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.window = window
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.max_ratio = max_ratio
+        self.registry = registry
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self._requests, self._hedged = 0, 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def _record(self, endpoint, latency):
+        with self._lock:
+            latencies = self._latencies.get(endpoint)
+            if latencies is None:
+                latencies = self._latencies[endpoint] = deque(maxlen=self.window)
+            latencies.append(latency)
+
+    def delay(self, endpoint):
+        """The delay (in seconds) before hedging a request of `endpoint`, None if it is not hedged"""
+        with self._lock:
+            latencies = self._latencies.get(endpoint)
+            if not latencies or len(latencies) < self.min_samples:
+                return None
+            latencies = sorted(latencies)
+        delay = latencies[int(math.ceil(self.percentile / 100. * len(latencies))) - 1]
+        delay = max(delay, self.min_delay)
+        return min(delay, self.max_delay) if self.max_delay else delay
+
+    def _may_hedge(self):
+        with self._lock:
+            if self._hedged >= self.max_ratio * self._requests:
+                return False
+            self._hedged += 1
+            return True
+
+    def call(self, endpoint, send, send_hedge=None):
+        """
+        Send a request, and a second one if the first is slower than the delay of `endpoint`
+        :param endpoint: the endpoint of the request (cf `metrics.endpoint_of`)
+        :param send: function without argument sending the request and returning the response
+        :param send_hedge: function sending the second request (default: `send`)
+        :return: the first response received
+        """
+        with self._lock:
+            self._requests += 1
+
+        t0 = time.perf_counter()
+        delay = self.delay(endpoint)
+        if delay is None:
+            response = send()
+            self._record(endpoint, time.perf_counter() - t0)
+            return response
+
+        first = self._executor.submit(send)
+        done, _ = wait([first], timeout=delay)
+        if done or not self._may_hedge():
+            response = first.result()
+            self._record(endpoint, time.perf_counter() - t0)
+            return response
+
+        self.registry.inc('pynexus_hedged_requests_total', endpoint=endpoint)
+        hedge = self._executor.submit(send_hedge or send)
+        pending, error = {first, hedge}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                if future is hedge:
+                    self.registry.inc('pynexus_hedge_wins_total', endpoint=endpoint)
+                self._record(endpoint, time.perf_counter() - t0)
+                return future.result()
+        raise error
+
+
+class CircuitBreaker(object):
+    """
+    Per endpoint circuit: closed (requests sent), open (requests rejected) or half-open (one probe sent)
+    """
+
+    def __init__(self, failure_threshold=5, recovery_time=30., registry=metrics.registry):
+        """
+        :param failure_threshold: the number of consecutive failures opening the circuit
+        :param recovery_time: the time (in seconds) before a probe is let through an open circuit
+        :param registry: the MetricsRegistry where to record the states of the circuits
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.registry = registry
+        self._lock = threading.Lock()
+        # endpoint -> [state, consecutive failures, opened at, probe in flight]
+        self._circuits = {}
+
+    def _circuit(self, endpoint):
+        circuit = self._circuits.get(endpoint)
+        if circuit is None:
+            circuit = self._circuits[endpoint] = [CLOSED, 0, 0., False]
+        return circuit
+
+    def _set_state(self, endpoint, circuit, state):
+        if state == OPEN and circuit[0] != OPEN:
+            self.registry.inc('pynexus_circuit_opened_total', endpoint=endpoint)
+        circuit[0] = state
+        self.registry.set('pynexus_circuit_state', state, endpoint=endpoint)
+
+    def state(self, endpoint):
+        with self._lock:
+            return self._circuit(endpoint)[0]
+
+    def before(self, endpoint):
+        """Raise CircuitOpenError if a request of `endpoint` must not be sent"""
+        with self._lock:
+            circuit = self._circuit(endpoint)
+            if circuit[0] == CLOSED:
+                return
+            if circuit[0] == OPEN and time.monotonic() - circuit[2] >= self.recovery_time:
+                self._set_state(endpoint, circuit, HALF_OPEN)
+            if circuit[0] == HALF_OPEN and not circuit[3]:
+                circuit[3] = True
+                return
+            self.registry.inc('pynexus_circuit_rejected_total', endpoint=endpoint)
+            retry_in = max(0., self.recovery_time - (time.monotonic() - circuit[2]))
+        raise CircuitOpenError('%s: circuit open, retry in %0.1fs' % (endpoint, retry_in))
+
+    def success(self, endpoint):
+        with self._lock:
+            circuit = self._circuit(endpoint)
+            circuit[1], circuit[3] = 0, False
+            if circuit[0] != CLOSED:
+                self._set_state(endpoint, circuit, CLOSED)
+
+    def failure(self, endpoint):
+        with self._lock:
+            circuit = self._circuit(endpoint)
+            circuit[1] += 1
+            if circuit[0] == HALF_OPEN or circuit[1] >= self.failure_threshold:
+                circuit[2], circuit[3] = time.monotonic(), False
+                self._set_state(endpoint, circuit, OPEN)
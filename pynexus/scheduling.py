@@ -0,0 +1,168 @@
+"""
+Priority-aware scheduling of the requests sharing one rate budget.
+
+    scheduler = RequestScheduler(rate=10)
+    api = AppNexusAPI(**APPNEXUS_ACCOUNT, scheduler=scheduler)
+    reports = ReportsAPI(**APPNEXUS_ACCOUNT, scheduler=scheduler)
+
+Each request waits for a permit of the scheduler. When the rate budget allows a request, the
+permit goes to the oldest caller waiting in the highest priority class:
+
+- INTERACTIVE: single lookups, the default
+- POLL: the polls of the reports and of the segment upload jobs
+- BULK: the catalog syncs (`bulk_request_get_all`, `bulk_requests`, `iter_all`...)
+
+so the interactive requests wait at most for the next permit, whatever the bulk work in progress.
+Within a class, the callers (threads, or the names given to `priority`) take turns.
+A RATE_EXCEEDED error pauses all the requests instead of only the one that received it.
+
+The class of the requests is set per thread:
+
+    with priority(BULK):
+        api.get_campaign(...)
+"""
+import contextlib
+import threading
+import time
+from collections import OrderedDict, deque
+
+from .ratelimit import RateLimiter
+
+INTERACTIVE, POLL, BULK = 0, 1, 2
+PRIORITIES = (INTERACTIVE, POLL, BULK)
+
+_context = threading.local()
+
+
+@contextlib.contextmanager
+def priority(level, caller=None):
+    """
+    Context (or decorator) giving the class `level` to the requests of the thread
+    :param level: INTERACTIVE, POLL or BULK
+    :param caller: the name of the caller for the fair queuing, default: the one of the enclosing context,
+                   or the thread
+    """
+    previous = getattr(_context, 'value', None)
+    if caller is None and previous is not None:
+        caller = previous[1]
+    _context.value = (level, caller)
+    try:
+        yield
+    finally:
+        _context.value = previous
+
+
+def current():
+    """(class, caller) of the requests of the thread"""
+    level, caller = getattr(_context, 'value', None) or (INTERACTIVE, None)
+    return level, caller if caller is not None else threading.get_ident()
+
+
+def bind(func, level=None):
+    """
+    `func` running with the class and the caller of the calling thread (ex: to run it in a pool of threads)
+    :param level: the class to use instead of the current one
+    """
+    context_level, caller = current()
+    level = context_level if level is None else level
+
+    def wrapper(*args, **kwargs):
+        with priority(level, caller):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+class RequestScheduler(object):
+    """
+    Gives the permits to send the requests, in the order of the priority classes and at the rate of the budget
+    """
+
+    def __init__(self, rate=None, per=1., burst=None, rate_limiter=None):
+        """
+        :param rate: number of requests allowed per `per` seconds (no limit if None)
+        :param per: the period in seconds
+        :param burst: the maximum number of requests made at once (default: `rate`)
+        :param rate_limiter: a `ratelimit.RateLimiter` to use as budget instead of `rate`
+                             (ex: one shared by many processes)
+        """
+        if rate_limiter is None and rate:
+            rate_limiter = RateLimiter(rate, per, burst)
+        self.rate_limiter = rate_limiter
+        self._cond = threading.Condition()
+        self._queues = {x: OrderedDict() for x in PRIORITIES}
+        self._waiting = 0
+        self._paused_until = 0.
+        self._dispatcher = None
+
+    def acquire(self, level=None, caller=None):
+        """
+        Wait for the permit to send a request
+        :param level: the class of the request, default: the one of the thread (cf `priority`)
+        :param caller: the caller for the fair queuing, default: the one of the thread
+        :return: the time waited (in seconds)
+        """
+        context_level, context_caller = current()
+        level = context_level if level is None else level
+        caller = context_caller if caller is None else caller
+
+        t0 = time.monotonic()
+        permit = threading.Event()
+        with self._cond:
+            if self.rate_limiter is None and t0 >= self._paused_until and not self._waiting:
+                return 0.
+            self._queues[level].setdefault(caller, deque()).append(permit)
+            self._waiting += 1
+            self._start()
+            self._cond.notify()
+        permit.wait()
+        return time.monotonic() - t0
+
+    def pause(self, seconds):
+        """Give no permit during `seconds` (ex: after a RATE_EXCEEDED error)"""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    @property
+    def waiting(self):
+        """Number of requests waiting for a permit, per class"""
+        with self._cond:
+            return {level: sum(len(x) for x in queue.values()) for level, queue in self._queues.items()}
+
+    def _start(self):
+        if self._dispatcher is None or not self._dispatcher.is_alive():
+            self._dispatcher = threading.Thread(target=self._dispatch, name='pynexus-scheduler', daemon=True)
+            self._dispatcher.start()
+
+    def _next_permit(self):
+        """The permit of the caller whose turn it is in the highest priority class waiting"""
+        for level in PRIORITIES:
+            queue = self._queues[level]
+            if queue:
+                caller, permits = next(iter(queue.items()))
+                permit = permits.popleft()
+                # the caller goes to the end of the line of its class
+                del queue[caller]
+                if permits:
+                    queue[caller] = permits
+                self._waiting -= 1
+                return permit
+        return None
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                while not self._waiting:
+                    self._cond.wait()
+                paused = self._paused_until - time.monotonic()
+
+            if paused > 0:
+                time.sleep(paused)
+                continue
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+
+            # the permit is given once the budget allows it, to the request of highest priority at that time
+            with self._cond:
+                permit = self._next_permit()
+            permit.set()
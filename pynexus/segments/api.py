@@ -2,7 +2,7 @@ import time
 from io import BytesIO
 
 from pynexus.base_api import BaseAPI
-from pynexus import logs
+from pynexus import logs, scheduling
 
 
 class SegmentUploadError(Exception):
@@ -40,6 +40,7 @@ class SegmentAPI(BaseAPI):
                                   data=data)
         return resp['segment_upload']['job_id']
 
+    @scheduling.priority(scheduling.POLL)
     def _get_segment_upload_progress(self, job_id, member_id=None):
         member_id = member_id or self.member_id
         return self._make_request(method='GET', url=self.batch_segment_url,
@@ -74,7 +75,7 @@ class SegmentAPI(BaseAPI):
             except KeyError as e:
                 logs.logger.warning("Key '%s' not found in %s" % (e.args[0], resp))
             finally:
-                time.sleep(2)
+                time.sleep(self.poll_interval)
 
         if not resp or 'batch_segment_upload_job' not in resp:
             raise SegmentUploadError(resp)
@@ -13,12 +13,13 @@ METRICS = ['num_valid', 'num_invalid_user', 'num_unauth_segment',
 
 
 @clock()
-def upload_segment(segment_id, user_ids, verbose=False, metrics=METRICS, member_id=None):
+def upload_segment(segment_id, user_ids, verbose=False, metrics=METRICS, member_id=None, api=None):
     """
     Upload a segment with a list of user_ids to AppNexus
+    :param api: the SegmentAPI to use, if not specified one is created with `settings.APPNEXUS_ACCOUNT`
     :return:
     """
-    api = SegmentAPI(**APPNEXUS_ACCOUNT, verbose=verbose)
+    api = api or SegmentAPI(**APPNEXUS_ACCOUNT, verbose=verbose)
 
     data = '\n'.join([str(x) for x in user_ids])
     data_fmt = format_data(data, segment_id)
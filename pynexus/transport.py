@@ -0,0 +1,153 @@
+"""
+The HTTP transports of the clients.
+
+    api = AppNexusAPI(**APPNEXUS_ACCOUNT)                                  # requests, HTTP/1.1
+    transport = HttpxTransport(http2=True)
+    api = AppNexusAPI(**APPNEXUS_ACCOUNT, transport=transport)              # HTTP/2
+    reports = ReportsAPI(**APPNEXUS_ACCOUNT, transport=transport, token=api.authenticate())
+
+A transport sends the requests (`request`, `arequest` for the asyncio code) and streams the downloads
+(`stream`), with the `headers` shared by all its requests. The clients send their own token with each
+request, so one transport can serve clients with different credentials. With
+HTTP/1.1 each request in flight needs its own connection; HTTP/2 multiplexes them over a few
+connections, which saves a TCP+TLS handshake per concurrent request.
+
+A transport has:
+    headers: dict of the headers sent with each request
+    transient_errors: the exceptions of the failures worth retrying (timeouts, connection errors)
+    request(method, url, timeout=None, **kwargs): the response (`status_code`, `json()`, `content`, truthy if ok)
+    stream(url, timeout=None, headers=None): the response, whose body is read with `iter_content(chunk_size)`
+    arequest(method, url, timeout=None, **kwargs): coroutine of the response
+    close()
+"""
+import functools
+
+import requests
+
+
+class RequestsTransport(object):
+    """
+    HTTP/1.1 transport of a `requests.Session`
+    """
+
+    transient_errors = (requests.Timeout, requests.ConnectionError)
+
+    def __init__(self, session=None):
+        """
+        :param session: the requests.Session to use
+        """
+        self.session = session or requests.Session()
+
+    @property
+    def headers(self):
+        return self.session.headers
+
+    def request(self, method, url, timeout=None, **kwargs):
+        return self.session.request(method, url, timeout=timeout, **kwargs)
+
+    def stream(self, url, timeout=None, headers=None):
+        return self.session.get(url, stream=True, timeout=timeout, headers=headers)
+
+    async def arequest(self, method, url, timeout=None, **kwargs):
+        """The request sent from a thread of the default executor of the loop"""
+        # imported here, the sync clients do not pay for it
+        import asyncio
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(self.request, method, url, timeout, **kwargs))
+
+    def close(self):
+        self.session.close()
+
+
+class HttpxResponse(object):
+    """`httpx.Response` with the interface of the `requests.Response` used by the clients"""
+
+    def __init__(self, response):
+        self.response = response
+
+    def __getattr__(self, name):
+        return getattr(self.response, name)
+
+    def __bool__(self):
+        return self.response.status_code < 400
+
+    @property
+    def content(self):
+        # the body of a streamed response is read first
+        return self.response.read()
+
+    def iter_content(self, chunk_size=None):
+        try:
+            for chunk in self.response.iter_bytes(chunk_size):
+                yield chunk
+        finally:
+            self.response.close()
+
+    def close(self):
+        self.response.close()
+
+
+class HttpxTransport(object):
+    """
+    HTTP/2 transport of `httpx` (pip install httpx[http2]): the requests in flight are multiplexed over
+    at most `max_connections` connections. The sync and the async clients share the headers.
+    """
+
+    def __init__(self, http2=True, max_connections=10, max_keepalive_connections=10, **client_kwargs):
+        """
+        :param http2: negotiate HTTP/2 (needs `h2`), HTTP/1.1 otherwise
+        :param max_connections: the maximum number of connections open at the same time
+        :param max_keepalive_connections: the number of idle connections kept
+        :param client_kwargs: other parameters of the httpx clients (ex: verify, proxies)
+        """
+        try:
+            import httpx
+        except ImportError:
+            raise ImportError('httpx is required for the HTTP/2 transport: pip install httpx[http2]')
+
+        self._httpx = httpx
+        self.transient_errors = (httpx.TransportError,)
+        self.headers = {}
+        self._client_kwargs = dict(client_kwargs, http2=http2, limits=httpx.Limits(
+            max_connections=max_connections, max_keepalive_connections=max_keepalive_connections))
+        self._client = httpx.Client(**self._client_kwargs)
+        self._async_client = None
+
+    def _request_kwargs(self, timeout, kwargs):
+        """The parameters of a `requests` call as httpx parameters"""
+        kwargs = dict(kwargs)
+        kwargs['headers'] = dict(self.headers, **(kwargs.get('headers') or {}))
+        data = kwargs.get('data')
+        if data is not None and not isinstance(data, dict):
+            # raw body (bytes, str or file-like object)
+            kwargs['content'] = kwargs.pop('data')
+            if hasattr(kwargs['content'], 'read'):
+                kwargs['content'] = kwargs['content'].read()
+        if 'allow_redirects' in kwargs:
+            kwargs['follow_redirects'] = kwargs.pop('allow_redirects')
+        kwargs.pop('stream', None)
+        kwargs['timeout'] = timeout
+        return kwargs
+
+    def request(self, method, url, timeout=None, **kwargs):
+        return HttpxResponse(self._client.request(method, url, **self._request_kwargs(timeout, kwargs)))
+
+    def stream(self, url, timeout=None, headers=None):
+        request = self._client.build_request('GET', url, headers=dict(self.headers, **(headers or {})),
+                                             timeout=timeout)
+        return HttpxResponse(self._client.send(request, stream=True))
+
+    async def arequest(self, method, url, timeout=None, **kwargs):
+        if self._async_client is None:
+            # bound to the event loop of its first request
+            self._async_client = self._httpx.AsyncClient(**self._client_kwargs)
+        response = await self._async_client.request(method, url, **self._request_kwargs(timeout, kwargs))
+        return HttpxResponse(response)
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    def close(self):
+        self._client.close()
@@ -1,4 +1,7 @@
 import functools
+import logging
+import reprlib
+import sys
 import time
 import zipfile
 from io import BytesIO
@@ -7,23 +10,32 @@ from .logs import logger
 
 DEFAULT_FMT = '[{name}] {elapsed:0.8f} min'
 
+_repr = reprlib.Repr()
+_repr.maxstring = _repr.maxother = 80
+
 
 def clock(fmt=DEFAULT_FMT):
     """
-    Computes and prints the duration of the function
+    Computes and logs the duration of the function.
+    The arguments and the result are only formatted if `fmt` uses them, and are truncated.
     :param fmt: format of the time.
     :return:
     """
+    with_args = '{args' in fmt or '{result' in fmt
 
     def decorate(func):
         @functools.wraps(func)
         def clocked(*args, **kwargs):
-            t0 = time.time()
+            t0 = time.perf_counter()
             _result = func(*args, **kwargs)
-            elapsed = (time.time() - t0) / 60.
+            if not logger.isEnabledFor(logging.INFO):
+                return _result
+
+            elapsed = (time.perf_counter() - t0) / 60.
             name = func.__name__
-            args = ', '.join(repr(arg) for arg in args)
-            result = repr(_result)
+            if with_args:
+                args = ', '.join(_repr.repr(arg) for arg in args)
+                result = _repr.repr(_result)
             logger.info(fmt.format(**locals()))
             return _result
         return clocked
@@ -35,6 +47,9 @@ def is_notebook():
     Test if running in notebook
     :return:
     """
+    if 'ipykernel' not in sys.modules:
+        return False
+
     try:
         from traitlets import TraitError
         from ipywidgets import IntProgress
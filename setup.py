@@ -8,8 +8,8 @@ except ImportError:
     from distutils.core import setup, find_packages
 
 
-if sys.version_info < (3, 3, 0):
-    raise RuntimeError("Pynexus requires Python 3.3.0+")
+if sys.version_info < (3, 7, 0):
+    raise RuntimeError("Pynexus requires Python 3.7.0+")
 
 with open(os.path.join(os.path.dirname(__file__), 'pynexus/__init__.py'), 'r') as fd:
     version = re.search(r'^__version__\s*=\s*[\'"]([^\'"]*)[\'"]',
@@ -25,9 +25,20 @@ setup(
     author_email="julien.brayere@veinteractive.com",
     packages=find_packages(),
     include_package_data=True,
+    python_requires=">=3.7",
     install_requires=[
         "tqdm",
         "requests",
         "coloredlogs"
     ],
+    extras_require={
+        "bonsai": ["numpy"],
+        "parquet": ["pyarrow"],
+        "http2": ["httpx[http2]"],
+    },
+    entry_points={
+        "console_scripts": [
+            "pynexus-jobs = pynexus.cli:main",
+        ],
+    },
 )